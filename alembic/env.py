@@ -16,7 +16,7 @@ if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
 from setup.database_setup import Base
-from models import users
+from models import audit, users
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 target_metadata = Base.metadata
@@ -0,0 +1,50 @@
+"""normalized identifiers
+
+Revision ID: d9e3f1a2c4b7
+Revises: b4c1e2d3a9f0
+Create Date: 2026-10-18 10:15:00.000000
+
+Online-safe: the columns are nullable without a default, so adding them
+only touches the catalog, and the unique indexes are built CONCURRENTLY
+without blocking writes. Existing rows are filled in afterwards by
+`python -m app.identifier_backfill`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9e3f1a2c4b7'
+down_revision: Union[str, Sequence[str], None] = 'b4c1e2d3a9f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ('username_normalized', 'email_normalized', 'phone_normalized')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the ALTER needs a brief exclusive lock; give up rather than queue
+    # behind a long transaction while every query on users queues behind us
+    op.execute("SET lock_timeout = '5s'")
+    for column in COLUMNS:
+        op.add_column('users', sa.Column(column, sa.String(), nullable=True), if_not_exists=True)
+    # CONCURRENTLY can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute("RESET lock_timeout")
+        for column in COLUMNS:
+            # a failed concurrent build leaves an INVALID index behind
+            op.drop_index(f'ix_users_{column}', table_name='users', if_exists=True, postgresql_concurrently=True)
+            op.create_index(f'ix_users_{column}', 'users', [column], unique=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            op.drop_index(f'ix_users_{column}', table_name='users', if_exists=True, postgresql_concurrently=True)
+    op.execute("SET lock_timeout = '5s'")
+    for column in COLUMNS:
+        op.drop_column('users', column)
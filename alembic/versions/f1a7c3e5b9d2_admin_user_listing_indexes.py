@@ -0,0 +1,47 @@
+"""admin user listing indexes
+
+Revision ID: f1a7c3e5b9d2
+Revises: d9e3f1a2c4b7
+Create Date: 2026-10-18 11:40:00.000000
+
+Keyset pagination on (created_at, id) and byte-wise prefix search on the
+normalised identifiers, all built CONCURRENTLY.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1a7c3e5b9d2'
+down_revision: Union[str, Sequence[str], None] = 'd9e3f1a2c4b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PREFIX_INDEXES = (
+    ('ix_users_username_prefix', 'username_normalized'),
+    ('ix_users_email_prefix', 'email_normalized'),
+    ('ix_users_phone_prefix', 'phone_normalized'),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        # a failed concurrent build leaves an INVALID index behind
+        op.drop_index('ix_users_created_at_id', table_name='users', if_exists=True, postgresql_concurrently=True)
+        op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], postgresql_concurrently=True)
+        for name, column in PREFIX_INDEXES:
+            op.drop_index(name, table_name='users', if_exists=True, postgresql_concurrently=True)
+            op.create_index(name, 'users', [column], postgresql_ops={column: 'varchar_pattern_ops'},
+                            postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, _ in PREFIX_INDEXES:
+            op.drop_index(name, table_name='users', if_exists=True, postgresql_concurrently=True)
+        op.drop_index('ix_users_created_at_id', table_name='users', if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,188 @@
+"""Admin API for listing, searching and exporting users.
+
+Pages are keyset paginated on (created_at, id), so a page costs the same
+at the start of the table as at the end; the export streams the same
+query through a server-side cursor and keeps memory flat however many
+rows it writes. Password hashes are never selected.
+"""
+import base64
+import csv
+import hashlib
+import hmac
+import io
+import logging
+import os
+from datetime import datetime
+from typing import Literal
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import StreamingResponse
+
+from models.users import UserAdminRead, UserPage, Users
+from app import identifiers
+from setup import audit_setup, database_setup
+from setup.database_setup import get_db
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# comma separated, so a token can be rotated without downtime; the
+# routes aren't mounted at all when none is set
+ADMIN_API_TOKENS = [token.strip() for token in os.getenv("ADMIN_API_TOKENS", "").split(",") if token.strip()]
+ADMIN_ENABLED = bool(ADMIN_API_TOKENS)
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", 50))
+ADMIN_MAX_PAGE_SIZE = int(os.getenv("ADMIN_MAX_PAGE_SIZE", 500))
+# rows fetched from the server-side cursor per round trip
+ADMIN_EXPORT_BATCH_SIZE = int(os.getenv("ADMIN_EXPORT_BATCH_SIZE", 1000))
+
+COLUMNS = (Users.id, Users.first_name, Users.last_name, Users.username, Users.email, Users.phone_number,
+           Users.active_status, Users.created_at, Users.updated_at)
+FIELD_NAMES = [column.key for column in COLUMNS]
+
+router = APIRouter(prefix="/admin/users", tags=["admin"])
+
+
+def require_admin_token(x_admin_token: str | None = Header(None)):
+    # compared against every token, so timing doesn't tell which one is close
+    matches = [hmac.compare_digest(x_admin_token.encode(), token.encode())
+               for token in ADMIN_API_TOKENS] if x_admin_token else []
+    if not any(matches):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail={"message":"Invalid or missing admin token"})
+    # which token was used, for the audit trail, without the token itself
+    return hashlib.sha256(x_admin_token.encode()).hexdigest()[:12]
+
+
+class UserFilters:
+    def __init__(
+        self,
+        created_after: datetime | None = None,
+        created_before: datetime | None = None,
+        active: bool | None = None,
+        prefix: str | None = Query(None, max_length=100),
+        field: Literal["username", "email", "phone_number"] = "username",
+        cursor: str | None = None,
+    ):
+        self.created_after = created_after
+        self.created_before = created_before
+        self.active = active
+        self.prefix = identifiers.normalize_prefix(field, prefix) if prefix and prefix.strip() else None
+        self.field = field
+        self.after = decode_cursor(cursor) if cursor else None
+
+    def audit_details(self):
+        return {
+            "created_after": self.created_after.isoformat() if self.created_after else None,
+            "created_before": self.created_before.isoformat() if self.created_before else None,
+            "active": self.active,
+            "field": self.field if self.prefix else None,
+            "prefix": self.prefix,
+        }
+
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(orjson.dumps([row.created_at.isoformat(), row.id])).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, user_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={"message":"Invalid cursor"})
+
+
+def user_query(filters):
+    statement = select(*COLUMNS)
+    if filters.created_after is not None:
+        statement = statement.where(Users.created_at >= filters.created_after)
+    if filters.created_before is not None:
+        statement = statement.where(Users.created_at < filters.created_before)
+    if filters.active is not None:
+        statement = statement.where(Users.active_status.is_(filters.active))
+    if filters.prefix:
+        # LIKE 'prefix%' on the normalised column, served by its pattern index
+        column = getattr(Users, identifiers.NORMALIZED_COLUMNS[filters.field])
+        statement = statement.where(column.startswith(filters.prefix, autoescape=True))
+    if filters.after is not None:
+        statement = statement.where(tuple_(Users.created_at, Users.id) > filters.after)
+    # matches ix_users_created_at_id, so rows come off the index without a sort
+    return statement.order_by(Users.created_at, Users.id)
+
+
+@router.get("", response_model=UserPage)
+async def list_users(filters: UserFilters = Depends(), limit: int = Query(ADMIN_PAGE_SIZE, ge=1),
+                     token_id: str = Depends(require_admin_token), db: AsyncSession = Depends(get_db)):
+    limit = min(limit, ADMIN_MAX_PAGE_SIZE)
+    # one extra row tells whether there is a next page
+    rows = await database_setup.read_rows(db, user_query(filters).limit(limit + 1))
+    audit_setup.emit(audit_setup.ADMIN_USER_ACCESS, audit_setup.SUCCESS, identifier=token_id,
+                     action="list", rows=min(len(rows), limit), **filters.audit_details())
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return UserPage(items=[UserAdminRead.model_validate(row) for row in rows[:limit]], next_cursor=next_cursor)
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # a leading =, +, - or @ is a formula to a spreadsheet; E.164 numbers are left alone
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@", "\t", "\r") and not value[1:].isdigit():
+        return "'" + value
+    return value
+
+
+def _ndjson_chunk(rows):
+    return b"".join(orjson.dumps(row._asdict()) + b"\n" for row in rows)
+
+
+def _csv_chunk(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(FIELD_NAMES)
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def _export_rows(statement, export_format, token_id, audit_details):
+    # a replica when one is healthy, the export is a long read the primary doesn't need
+    replica = database_setup.pick_replica()
+    session_local = replica.session_local if replica is not None else database_setup.session_local
+    exported = 0
+    outcome = audit_setup.FAILURE
+    try:
+        if export_format == "csv":
+            yield _csv_chunk([], header=True)
+        async with session_local() as db:
+            result = await db.stream(statement.execution_options(yield_per=ADMIN_EXPORT_BATCH_SIZE))
+            async for rows in result.partitions():
+                yield _csv_chunk(rows) if export_format == "csv" else _ndjson_chunk(rows)
+                exported += len(rows)
+        outcome = audit_setup.SUCCESS
+    except (DBAPIError, OSError) as e:
+        # the status line is long gone; the client sees a truncated body
+        if replica is not None:
+            replica.mark_down(e)
+        logger.error("User export failed after %s rows: %s", exported, e)
+    finally:
+        audit_setup.emit(audit_setup.ADMIN_USER_ACCESS, outcome, identifier=token_id,
+                         action="export", format=export_format, rows=exported, **audit_details)
+
+
+@router.get("/export")
+async def export_users(filters: UserFilters = Depends(), export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+                       token_id: str = Depends(require_admin_token)):
+    """Stream every matching user, oldest first; a cursor resumes an interrupted export."""
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    filename = f"users-{datetime.now():%Y%m%dT%H%M%S}.{export_format}"
+    return StreamingResponse(
+        _export_rows(user_query(filters), export_format, token_id, filters.audit_details()),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,195 +1,263 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 import logging
-from fastapi.responses import JSONResponse
-from models.users import Users
-import jwt
 import os
-import time
+import redis.asyncio as redis
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from setup.database_setup import get_db
-from app import auth_validation
-import random 
-from setup import redis_setup
-from providers.mock_provider import MockMessageProvider
+from setup.response_setup import ORJSONResponse, ValidationRoute
+from app import (auth_validation, credential_cache, identifiers, otp_store, rate_limit, refresh_tokens, revocation,
+                 single_flight, tokens)
+from models.auth import (EmailLoginRequest, LoginRequest, LogoutRequest, MessageResponse, OtpRequest,
+                         PhoneLoginRequest, RefreshRequest, TokenResponse)
+from setup import audit_setup, database_setup, message_dispatcher, redis_setup
 
-jwt_secret = os.getenv("SECRET")
-jwt_algorithm = os.getenv("ALGORITHM")
+router = APIRouter(prefix="/api", route_class=ValidationRoute)
 
-router = APIRouter()
-
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-@router.post("/login")
-async def login_user(payload: dict, db: Session = Depends(get_db)):
+@router.post("/login", response_model=TokenResponse, dependencies=[Depends(rate_limit.limit_login("username"))])
+async def login_user(payload: LoginRequest):
     try:
-        data = dict(payload)
-        username = data.get("username", "")
-        password = data.get("password", "")
-        
-        validation_messages = await auth_validation.login_validation({"username":username,"password":password})
-        if validation_messages:
-            logger.error(f"Validation errors: {validation_messages}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail={"messages":validation_messages})
+        username = payload.username
+        password = payload.password
         
-        user = db.query(Users).filter(Users.username == username).first()
-        if not user:
-            logger.warning(f"username is invalid:{username}")
+        user_id, password_validation = await authenticate("username", username, password)
+        if user_id is None:
+            logger.warning("username is invalid:%s", username, extra={"sampled": True})
+            audit_setup.emit(audit_setup.LOGIN, audit_setup.FAILURE, identifier=username, method="password", reason="unknown_user")
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                 detail={"message":"Invalid credentials."})
         
-        password_validation = await auth_validation.password_check_validation(password, user)
         if not password_validation:
-            logger.warning(f"password is incorrect for username:{user.username}")
+            logger.warning("password is incorrect for username:%s", username, extra={"sampled": True})
+            audit_setup.emit(audit_setup.LOGIN, audit_setup.FAILURE, user_id, username, method="password", reason="bad_password")
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                 detail={"message":"Invalid credentials."})
-        get_token = await token_creation(user.id)
+        get_token = await token_creation(user_id)
         
-        logger.info(f"Successful login for user: {user.username}")
-        return JSONResponse(status_code=200,content=get_token)
+        logger.info("Successful login for user: %s", username)
+        audit_setup.emit(audit_setup.LOGIN, audit_setup.SUCCESS, user_id, username, method="password")
+        return ORJSONResponse(status_code=200,content=get_token)
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Internal Server Error during login: {str(e)}")
+        logger.error("Internal Server Error during login: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error"})
     
 
-@router.post("/login/email")
-async def login_with_email(payload:dict, db: Session= Depends(get_db) ):
+@router.post("/login/email", response_model=TokenResponse, dependencies=[Depends(rate_limit.limit_login("email"))])
+async def login_with_email(payload: EmailLoginRequest):
     try:
-        data = dict(payload)
-        email = data.get("email")
-        password = data.get("password")
-        validation_check = await auth_validation.login_validation({"email":email,"password":password})
-        if validation_check:
-            logger.error(f"validation error : {validation_check}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail={"message":validation_check})
-        user = db.query(Users).filter(Users.email == email).first()
+        email = payload.email
+        password = payload.password
+        user_id, password_validation = await authenticate("email", email, password)
         
-        if not user:
-            logger.warning(f"user with email {email} not found")
+        if user_id is None:
+            logger.warning("user with email %s not found", email, extra={"sampled": True})
+            audit_setup.emit(audit_setup.LOGIN, audit_setup.FAILURE, identifier=email, method="email", reason="unknown_user")
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail={"message":"Invalid credentials."})
         
-        password_validation = await auth_validation.password_check_validation(password, user)
         if not password_validation:
-            logger.warning(f"password for user_id:{user.id} is invalid")
+            logger.warning("password for user_id:%s is invalid", user_id, extra={"sampled": True})
+            audit_setup.emit(audit_setup.LOGIN, audit_setup.FAILURE, user_id, email, method="email", reason="bad_password")
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail={"message":"Invalid credentials."})
         
-        get_token = await token_creation(user.id)
+        get_token = await token_creation(user_id)
         logger.info("token is created successfully")
-        return JSONResponse(status_code=200, content=get_token)
+        audit_setup.emit(audit_setup.LOGIN, audit_setup.SUCCESS, user_id, email, method="email")
+        return ORJSONResponse(status_code=200, content=get_token)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Internal Server Error during login: {str(e)}")
+        logger.error("Internal Server Error during login: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error"})
     
     
-@router.post("/login/otp")
-async def login_otp(payload:dict, db: Session = Depends(get_db)):
+@router.post("/login/otp", response_model=MessageResponse, dependencies=[Depends(rate_limit.limit_login("phone_number"))])
+async def login_otp(payload: OtpRequest):
     try:
-        data = dict(payload)
-        phone_number = data.get("phone_number")
-        validation_check = await auth_validation.login_validation({"phone_number":phone_number})
-        if validation_check:
-            logger.error(f"validation error : {validation_check}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail={"message":validation_check})
-        otp = await send_otp(phone_number)
-        if otp:
-            mock_message = await MockMessageProvider().send_message(to=phone_number, message=f"Your OTP is {otp}")
-            logger.info(f"OTP is send successfully:{mock_message}")
-            return JSONResponse(status_code=200, content={"message":f"OTP is send successfully"})
+        # one OTP per number, whichever format it was typed in
+        phone_number = identifiers.normalize_phone(payload.phone_number)
+        dispatcher = message_dispatcher.get_dispatcher()
+        if dispatcher.is_full():
+            logger.warning("Message queue is full, rejecting OTP request")
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail={"message":"Service is busy, please try again later."},
+                                headers={"Retry-After": "1"})
+        # a retried duplicate shares the OTP being issued instead of hitting the one-OTP-per-number guard
+        await single_flight.do("otp", single_flight.flight_key("otp", phone_number), lambda: issue_otp(phone_number))
+        return ORJSONResponse(status_code=200, content={"message":f"OTP is send successfully"})
     except HTTPException:
         raise 
     except Exception as e:
-        logger.error(f"Internal Server Error: {str(e)}")
+        logger.error("Internal Server Error: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error"})
 
-@router.post("/login/phone")
-async def login_with_phone(payload:dict, db: Session = Depends(get_db)):
+@router.post("/login/phone", response_model=TokenResponse, dependencies=[Depends(rate_limit.limit_login("phone_number"))])
+async def login_with_phone(payload: PhoneLoginRequest, db: AsyncSession = Depends(get_db)):
     try:
-        data = dict(payload)
-        phone_number = data.get("phone_number")
-        otp = data.get("otp")
-        
-        validation_check = await auth_validation.login_validation({"phone_number":phone_number,"otp":otp})
-        if validation_check:
-            logger.error(f"validation error : {validation_check}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail={"message":validation_check})
+        phone_number = identifiers.normalize_phone(payload.phone_number)
+        otp = payload.otp
         
         redis_client = redis_setup.redis_info()
         if not redis_client:
             logger.warning("Redis is not working right now")
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error"})
+            raise redis_setup.redis_breaker.unavailable()
         
-        cached_otp = redis_client.get(phone_number)
-        logger.info(f"cached_otp retrieved for phone number {phone_number}:{cached_otp},type:{type(cached_otp)}")
-        if not cached_otp or cached_otp != otp:
-            logger.warning(f"Invalid OTP for phone number: {phone_number}")
+        otp_result = await otp_store.consume(redis_client, phone_number, otp)
+        if otp_result == otp_store.LOCKED:
+            logger.warning("Too many invalid OTP attempts for phone number: %s", phone_number)
+            audit_setup.emit(audit_setup.LOGIN, audit_setup.FAILURE, identifier=phone_number, method="otp", reason="otp_locked")
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,detail={"message":"Too many invalid attempts, request a new OTP."})
+        if otp_result != otp_store.CONSUMED:
+            logger.warning("Invalid OTP for phone number: %s", phone_number, extra={"sampled": True})
+            audit_setup.emit(audit_setup.LOGIN, audit_setup.FAILURE, identifier=phone_number, method="otp", reason="invalid_otp")
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail={"message":"Invalid OTP"})
+        logger.info("cached otp consumed for phone number %s", phone_number)
         
-        user = db.query(Users).filter(Users.phone_number == phone_number).first()
+        # as typed, a row the backfill hasn't normalised yet is matched on it
+        user = await credential_cache.get_credentials(db, "phone_number", payload.phone_number)
         if not user:
-            logger.warning(f"user with phone number {phone_number} not found")
+            logger.warning("user with phone number %s not found", phone_number)
+            audit_setup.emit(audit_setup.LOGIN, audit_setup.FAILURE, identifier=phone_number, method="otp", reason="unknown_user")
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail={"message":"Invalid credentials."})
         
         get_token = await token_creation(user.id)
         logger.info("token is created successfully")
-        redis_client.delete(phone_number)
-        logger.info(f"cached otp deleted for phone number {phone_number}")
-        return JSONResponse(status_code=200, content=get_token)
+        audit_setup.emit(audit_setup.LOGIN, audit_setup.SUCCESS, user.id, phone_number, method="otp")
+        return ORJSONResponse(status_code=200, content=get_token)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Internal Server Error during login: {str(e)}")
+        logger.error("Internal Server Error during login: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error"})
     
 
-async def token_creation(user_id):
+@router.post("/token/refresh", response_model=TokenResponse, dependencies=[Depends(rate_limit.limit_client("refresh", rate_limit.RATE_LIMIT_REFRESH))])
+async def refresh_token(payload: RefreshRequest):
+    try:
+        redis_client = redis_setup.redis_info()
+        if not redis_client:
+            logger.warning("Redis is not working right now")
+            raise redis_setup.redis_breaker.unavailable()
+        result, user_id, new_refresh_token = await refresh_tokens.rotate(redis_client, payload.refresh_token)
+        if result != refresh_tokens.ROTATED:
+            logger.warning("Invalid refresh token presented", extra={"sampled": True})
+            audit_setup.emit(audit_setup.TOKEN_REFRESH, audit_setup.FAILURE,
+                             reason="reused" if result == refresh_tokens.REUSED else "invalid")
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail={"message":"Invalid refresh token"})
+        get_token = await token_creation(user_id, new_refresh_token)
+        logger.info("token is refreshed for user_id:%s", user_id)
+        audit_setup.emit(audit_setup.TOKEN_REFRESH, audit_setup.SUCCESS, user_id)
+        return ORJSONResponse(status_code=200, content=get_token)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Internal Server Error during token refresh: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error"})
+
+
+@router.post("/logout", response_model=MessageResponse)
+async def logout(payload: LogoutRequest, claims: dict = Depends(tokens.get_token_claims)):
     try:
-        payload= {
-            "user_id" : user_id,
-            "expires" : time.time() + 900
-        }
-        token = jwt.encode(payload, jwt_secret, algorithm=jwt_algorithm)
+        redis_client = redis_setup.redis_info()
+        if not redis_client:
+            logger.warning("Redis is not working right now")
+            raise redis_setup.redis_breaker.unavailable()
+        if claims.get("jti"):
+            await revocation.revoke(claims["jti"], claims["exp"])
+        if payload.refresh_token:
+            await refresh_tokens.revoke_family(redis_client, payload.refresh_token)
+        logger.info("user_id:%s logged out", claims.get("user_id"))
+        audit_setup.emit(audit_setup.LOGOUT, audit_setup.SUCCESS, claims.get("user_id"))
+        return ORJSONResponse(status_code=200, content={"message":"Logged out successfully"})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Internal Server Error during logout: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error"})
+    
+
+async def token_creation(user_id, refresh_token=None):
+    try:
+        token = tokens.create_token(user_id)
         
         if not token:
-            logger.error(f"Token creation failed for user ID: {user_id}")
+            logger.error("Token creation failed for user ID: %s", user_id)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                                 detail={"Authentication service temporarily unavailable"})
-        return {
+                                 detail={"message":"Authentication service temporarily unavailable"})
+        response = {
                 "token": token,
                 "token_type": "bearer",  
-                "user_id": user_id    
+                "user_id": user_id,
+                "expires_in": tokens.TOKEN_TTL_SECONDS,
             }
+        if refresh_token is None:
+            # without Redis the login still succeeds, just without a refresh token
+            redis_client = redis_setup.redis_info()
+            if redis_client:
+                try:
+                    refresh_token = await refresh_tokens.issue(redis_client, user_id)
+                except redis.RedisError as e:
+                    logger.warning("Refresh token could not be issued for user ID %s: %s", user_id, e)
+        if refresh_token is not None:
+            response["refresh_token"] = refresh_token
+        return response
     except HTTPException:
         raise
     
     except Exception as e:
-        logger.error(f"Internal Server Error: {str(e)}")
+        logger.error("Internal Server Error: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error In Token Creation"})
 
+async def issue_otp(phone_number):
+    otp = await send_otp(phone_number)
+    # delivery happens in the background, the request only waits for the enqueue
+    try:
+        message_id = message_dispatcher.get_dispatcher().enqueue(phone_number, f"Your OTP is {otp}")
+    except message_dispatcher.DispatcherFull:
+        await otp_store.revoke(redis_setup.redis_info(), phone_number)
+        logger.warning("Message queue is full, OTP for %s revoked", phone_number)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail={"message":"Service is busy, please try again later."},
+                            headers={"Retry-After": "1"})
+    logger.info("OTP is queued for %s as message %s", phone_number, message_id)
+    audit_setup.emit(audit_setup.OTP_ISSUED, audit_setup.SUCCESS, identifier=phone_number, message_id=message_id)
+    return message_id
+
+
+async def _check_credentials(field, identifier, password):
+    # its own session, the shared run can outlive the request that started it
+    async with database_setup.session_local() as db:
+        user = await credential_cache.get_credentials(db, field, identifier)
+        if not user:
+            return None, False
+        return user.id, await auth_validation.password_check_validation(password, user, db)
+
+
+async def authenticate(field, identifier, password):
+    """Return (user id or None, password valid); concurrent duplicates share one lookup and verify."""
+    key = single_flight.flight_key("login", field, identifiers.normalize(field, identifier), password)
+    return await single_flight.do("login", key, lambda: _check_credentials(field, identifier, password))
+
+
 async def send_otp(phone_number: str):
     try:
         redis_client = redis_setup.redis_info()
         if not redis_client:
             logger.warning("Redis is not working right now")
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error"})  
-        get_cached_phone = redis_client.get(phone_number)
-        if get_cached_phone:
-            logger.warning(f"otp request in 90 seconds for {phone_number}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail={"message":"You can not send two request in 90 seconds"})
-        else:
-            otp_length = 6
-            otp_creation = ''.join([str(random.randint(0, 9)) for _ in range(otp_length)])
-            redis_client.setex(phone_number, 90, otp_creation)
-            return otp_creation
+            raise redis_setup.redis_breaker.unavailable()  
+        otp_creation = otp_store.generate_otp()
+        issued = await otp_store.issue(redis_client, phone_number, otp_creation)
+        if not issued:
+            logger.warning("otp request in %s seconds for %s", otp_store.OTP_TTL_SECONDS, phone_number)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail={"message":f"You can not send two request in {otp_store.OTP_TTL_SECONDS} seconds"})
+        return otp_creation
     except HTTPException:
         raise 
     except Exception as e:
-        logger.error(f"Internal Server Error: {str(e)}")
+        logger.error("Internal Server Error: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error"})
@@ -1,40 +1,41 @@
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import update
 import logging
-from passlib.context import CryptContext
+from models.users import Users
+from setup import hashing_setup
+from app import credential_cache
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 
-async def login_validation(validation_dict):
+async def password_check_validation(password, user, db=None):
     try:
-        message = []
-        for item in validation_dict:            
-            if not validation_dict[item]:
-                logger.error(f"Login failed: {item} is empty.")
-                message.append(f"{item} is required.")
-                
-            elif not isinstance(validation_dict[item], str):
-                logger.error(f"Login failed: {item} must be string.")
-                message.append(f"{item} must be string.")
-                
-            elif validation_dict[item].strip() == "":
-                logger.error(f"Login failed: {item} is empty.")
-                message.append(f"{item} is required.")
-                
-        return message
-    except Exception as e:
-        logger.error(f"Error during login validation: {str(e)}")
-        return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error during validation"})
-
-async def password_check_validation(password, user):
-    try:
-        password_check = pwd_context.verify(password, user.password)
+        password_check, new_hash = await hashing_setup.verify_and_update(password, user.password)
         if not password_check:
             return False
+        if new_hash and db is not None:
+            await rehash_password(db, user.id, new_hash)
         return True
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error during password validation: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error during password validation"})
+
+
+async def rehash_password(db, user_id, new_hash):
+    # migrates users to the current hashing policy as they log in; a
+    # failure here must not fail the login itself
+    try:
+        result = await db.execute(
+            update(Users).where(Users.id == user_id).values(password=new_hash)
+            .returning(Users.username, Users.email, Users.phone_number)
+        )
+        identifiers = result.first()
+        await db.commit()
+        if identifiers:
+            await credential_cache.invalidate(*identifiers)
+        logger.info("password hash upgraded for user_id:%s", user_id)
     except Exception as e:
-        logger.error(f"Error during password validation: {str(e)}")
-        return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail={"message":"Internal Server Error during password validation"})
\ No newline at end of file
+        await db.rollback()
+        logger.error("Password rehash failed for user_id:%s: %s", user_id, e)
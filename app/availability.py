@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from models.users import Users
+from app import credential_cache, identifiers
+from setup import database_setup
+from setup.metrics_setup import timed_stage
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+AVAILABILITY_BLOOM_CAPACITY = int(os.getenv("AVAILABILITY_BLOOM_CAPACITY", 1000000))
+AVAILABILITY_BLOOM_ERROR_RATE = float(os.getenv("AVAILABILITY_BLOOM_ERROR_RATE", 0.01))
+# picks up users registered by other workers
+AVAILABILITY_REFRESH_INTERVAL = float(os.getenv("AVAILABILITY_REFRESH_INTERVAL", 5))
+AVAILABILITY_LOAD_BATCH_SIZE = int(os.getenv("AVAILABILITY_LOAD_BATCH_SIZE", 10000))
+# ids below the highest one seen are read again on every refresh: an
+# insert that took its id earlier can commit after a later one
+AVAILABILITY_RESCAN_IDS = int(os.getenv("AVAILABILITY_RESCAN_IDS", 1000))
+
+FIELDS = credential_cache.LOOKUP_FIELDS
+
+
+class BloomFilter:
+    """Bit array answering "definitely absent" or "maybe present"."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        # double hashing: k positions from two 64-bit halves
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+_filter = BloomFilter(AVAILABILITY_BLOOM_CAPACITY, AVAILABILITY_BLOOM_ERROR_RATE)
+_ready = False
+_last_user_id = 0
+_refresh_task = None
+
+
+def _item(field, value):
+    return f"{field}:{identifiers.normalize(field, value)}"
+
+
+def add(username=None, email=None, phone_number=None):
+    for field, value in zip(FIELDS, (username, email, phone_number)):
+        if value is not None:
+            _filter.add(_item(field, value))
+
+
+def might_exist(field, value):
+    # until the filter is loaded nothing can be ruled out
+    return not _ready or _item(field, value) in _filter
+
+
+async def _load_new_users():
+    global _last_user_id
+    # adding a user twice is harmless to the filter
+    after_id = max(0, _last_user_id - AVAILABILITY_RESCAN_IDS)
+    async with database_setup.session_local() as db:
+        while True:
+            result = await db.execute(
+                select(Users.id, Users.username, Users.email, Users.phone_number)
+                .where(Users.id > after_id)
+                .order_by(Users.id)
+                .limit(AVAILABILITY_LOAD_BATCH_SIZE)
+            )
+            rows = result.all()
+            for user_id, username, email, phone_number in rows:
+                add(username, email, phone_number)
+            if rows:
+                after_id = rows[-1][0]
+                _last_user_id = max(_last_user_id, after_id)
+            if len(rows) < AVAILABILITY_LOAD_BATCH_SIZE:
+                return
+
+
+async def _refresh_loop():
+    global _ready
+    while True:
+        try:
+            await _load_new_users()
+            if not _ready:
+                _ready = True
+                logger.info("Availability filter loaded up to user id %s", _last_user_id)
+        except Exception as e:
+            logger.warning("Availability filter refresh failed: %s", e)
+        await asyncio.sleep(AVAILABILITY_REFRESH_INTERVAL)
+
+
+def start():
+    # loads in the background, startup doesn't wait for the users table scan
+    global _refresh_task
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        await asyncio.gather(_refresh_task, return_exceptions=True)
+        _refresh_task = None
+
+
+@timed_stage("availability_check")
+async def taken_fields(db, username=None, email=None, phone_number=None):
+    """Return the given identifiers that already belong to a user.
+
+    The filter rules out most new values in memory; only possible matches
+    are confirmed through the credential cache.
+    """
+    taken = []
+    for field, value in zip(FIELDS, (username, email, phone_number)):
+        if value is None or not might_exist(field, value):
+            continue
+        if await credential_cache.get_credentials(db, field, value) is not None:
+            taken.append(field)
+    return taken
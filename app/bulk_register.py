@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+
+from models.users import Users, UserCreate
+from setup import audit_setup, database_setup, hashing_setup, logging_setup
+from app import availability, credential_cache, identifiers
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# 11 bound parameters per row, kept under the 32767 parameter limit
+BULK_BATCH_SIZE = min(int(os.getenv("BULK_BATCH_SIZE", 500)), 2900)
+BULK_HASH_RETRY_SECONDS = float(os.getenv("BULK_HASH_RETRY_SECONDS", 1))
+BULK_HASH_MAX_ATTEMPTS = int(os.getenv("BULK_HASH_MAX_ATTEMPTS", 30))
+# request bodies larger than this are spooled to a temporary file
+BULK_SPOOL_MAX_MEMORY = int(os.getenv("BULK_SPOOL_MAX_MEMORY", 1024 * 1024))
+# larger imports go through `python -m app.bulk_register`
+BULK_MAX_BODY_BYTES = int(os.getenv("BULK_MAX_BODY_BYTES", 64 * 1024 * 1024))
+
+
+def _validation_errors(error):
+    return [f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()]
+
+
+async def _hash(password):
+    # bulk imports wait for the hashing queue to drain, for a while, instead of failing
+    for attempt in range(1, BULK_HASH_MAX_ATTEMPTS + 1):
+        try:
+            return await hashing_setup.hash_bulk(password)
+        except HTTPException as e:
+            if e.status_code != status.HTTP_503_SERVICE_UNAVAILABLE or attempt == BULK_HASH_MAX_ATTEMPTS:
+                raise
+            await asyncio.sleep(BULK_HASH_RETRY_SECONDS)
+
+
+async def _hash_batch(passwords):
+    return await asyncio.gather(*(_hash(password) for password in passwords))
+
+
+async def _insert_batch(db, batch):
+    results = []
+    pending = []
+    seen = set()
+    for line_number, user in batch:
+        user_identifiers = {item for item in identifiers.normalized_columns(user.username, user.email, user.phone_number).items()
+                            if item[1] is not None}
+        if user_identifiers & seen:
+            results.append({"line": line_number, "username": user.username, "status": "conflict",
+                            "errors": ["duplicate of an earlier record in the same batch"]})
+            continue
+        seen |= user_identifiers
+        pending.append((line_number, user))
+
+    if pending:
+        hashed_passwords = await _hash_batch([user.password for _, user in pending])
+        now = datetime.now()
+        rows = [
+            {
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "username": user.username,
+                "email": user.email,
+                "phone_number": user.phone_number,
+                **identifiers.normalized_columns(user.username, user.email, user.phone_number),
+                "password": hashed_password,
+                "active_status": True,
+                "created_at": now,
+            }
+            for (_, user), hashed_password in zip(pending, hashed_passwords)
+        ]
+        insert = database_setup.insert_by_dialect[db.bind.dialect.name]
+        statement = insert(Users).values(rows).on_conflict_do_nothing().returning(Users.username)
+        inserted = set((await db.execute(statement)).scalars().all())
+        await db.commit()
+        await credential_cache.invalidate_many(
+            (user.username, user.email, user.phone_number) for _, user in pending if user.username in inserted
+        )
+        for _, user in pending:
+            if user.username in inserted:
+                availability.add(user.username, user.email, user.phone_number)
+                audit_setup.emit(audit_setup.REGISTRATION, audit_setup.SUCCESS, identifier=user.username, source="bulk")
+        for line_number, user in pending:
+            if user.username in inserted:
+                results.append({"line": line_number, "username": user.username, "status": "created"})
+            else:
+                results.append({"line": line_number, "username": user.username, "status": "conflict",
+                                "errors": ["user with this info:(email or username or phone number) already exists"]})
+
+    results.sort(key=lambda item: item["line"])
+    return results
+
+
+async def register_stream(lines, batch_size=BULK_BATCH_SIZE):
+    """Register users from an iterable of JSON lines, yielding one result per line.
+
+    Only one batch is held in memory at a time, whatever the input size.
+    """
+    batch = []
+    async with database_setup.session_local() as db:
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                user = UserCreate.model_validate_json(line)
+            except ValidationError as e:
+                yield {"line": line_number, "status": "invalid", "errors": _validation_errors(e)}
+                continue
+            batch.append((line_number, user))
+            if len(batch) >= batch_size:
+                for result in await _insert_batch(db, batch):
+                    yield result
+                batch = []
+        if batch:
+            for result in await _insert_batch(db, batch):
+                yield result
+
+
+async def _run(path, output):
+    summary = {}
+    with open(path, "rb") as source:
+        async for result in register_stream(source):
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+            output.write(json.dumps(result) + "\n")
+    return summary
+
+
+async def _main(args):
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        summary = await _run(args.path, output)
+        logger.info("Bulk registration finished: %s", summary)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        hashing_setup.shutdown_executor()
+        await database_setup.close_engine()
+
+
+def main():
+    logging_setup.configure_logging()
+    parser = argparse.ArgumentParser(description="Register users from a JSONL file of UserCreate records.")
+    parser.add_argument("path", help="JSONL file, one user per line")
+    parser.add_argument("-o", "--output", help="write per-record results here instead of stdout")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
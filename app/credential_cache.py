@@ -0,0 +1,165 @@
+import json
+import logging
+import math
+import os
+from typing import NamedTuple
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_, select
+
+from models.users import Users
+from app import identifiers
+from app.local_cache import LocalCache, MISSING
+from setup import database_setup, redis_setup
+from setup.metrics_setup import timed_stage
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+CREDENTIAL_CACHE_SIZE = int(os.getenv("CREDENTIAL_CACHE_SIZE", 10000))
+CREDENTIAL_CACHE_TTL = float(os.getenv("CREDENTIAL_CACHE_TTL", 30))
+CREDENTIAL_REDIS_TTL = int(os.getenv("CREDENTIAL_REDIS_TTL", 300))
+# unknown identifiers are cached briefly so brute force on missing
+# accounts doesn't reach Postgres either
+CREDENTIAL_NEGATIVE_TTL = int(os.getenv("CREDENTIAL_NEGATIVE_TTL", 5))
+# rows the identifier backfill hasn't reached yet are matched as typed;
+# can be turned off once it has run
+CREDENTIAL_RAW_FALLBACK = os.getenv("CREDENTIAL_RAW_FALLBACK", "true").lower() == "true"
+
+LOOKUP_FIELDS = ("username", "email", "phone_number")
+
+# cached in place of credentials right after a write, so lookups go to the
+# primary until the replicas have caught up; "!" never starts an encoding
+PRIMARY_PIN = "!primary"
+
+
+class Credentials(NamedTuple):
+    id: int
+    password: str
+    active_status: bool
+
+
+_local_cache = LocalCache(CREDENTIAL_CACHE_SIZE)
+
+
+def _cache_key(field, value):
+    return f"{field}:{value}"
+
+
+def _redis_key(key):
+    return f"cred:{key}"
+
+
+def _encode(credentials):
+    return "" if credentials is None else json.dumps(list(credentials))
+
+
+def _decode(raw):
+    return None if raw == "" else Credentials(*json.loads(raw))
+
+
+@timed_stage("db_credential_query")
+async def _query(db, field, value, primary=False):
+    """Return (credentials, matched_raw) for a login identifier as typed."""
+    normalized = identifiers.normalize(field, value)
+    normalized_column = getattr(Users, identifiers.NORMALIZED_COLUMNS[field])
+    condition = normalized_column == normalized
+    statement = select(Users.id, Users.password, Users.active_status, normalized_column)
+    if CREDENTIAL_RAW_FALLBACK:
+        # legacy rows may hold either spelling, "0664 1234567" or "+436641234567"
+        raw_match = and_(normalized_column.is_(None), getattr(Users, field).in_({value, normalized}))
+        # an account left unnormalised by a backfill conflict wins when typed exactly
+        statement = statement.where(or_(condition, raw_match)).order_by(raw_match.desc())
+    else:
+        statement = statement.where(condition)
+    statement = statement.limit(1)
+    if primary:
+        rows = (await db.execute(statement)).all()
+    else:
+        rows = await database_setup.read_rows(db, statement)
+    if not rows:
+        return None, False
+    return Credentials(*rows[0][:3]), rows[0][3] is None
+
+
+@timed_stage("credential_lookup")
+async def get_credentials(db, field, value):
+    """Return (id, password hash, active_status) for a login identifier, or None."""
+    if field not in LOOKUP_FIELDS:
+        raise ValueError(f"unsupported lookup field: {field}")
+    # Foo@x.com and foo@x.com share one cache entry
+    key = _cache_key(field, identifiers.normalize(field, value))
+    credentials = _local_cache.get(key)
+    primary = credentials == PRIMARY_PIN
+    if credentials is not MISSING and not primary:
+        return credentials
+
+    redis_client = redis_setup.redis_info()
+    if redis_client and not primary:
+        try:
+            raw = await redis_client.get(_redis_key(key))
+            if raw == PRIMARY_PIN:
+                primary = True
+            elif raw is not None:
+                credentials = _decode(raw)
+                _local_cache.set(key, credentials, CREDENTIAL_CACHE_TTL if credentials else CREDENTIAL_NEGATIVE_TTL)
+                return credentials
+        except redis.RedisError as e:
+            logger.warning("Credential cache read failed: %s", e)
+
+    credentials, matched_raw = await _query(db, field, value, primary)
+    if matched_raw:
+        # found through the spelling typed, another spelling may not find
+        # it; not cached until the backfill has normalised the row
+        return credentials
+    ttl = CREDENTIAL_REDIS_TTL if credentials else CREDENTIAL_NEGATIVE_TTL
+    _local_cache.set(key, credentials, min(ttl, CREDENTIAL_CACHE_TTL))
+    if redis_client:
+        try:
+            await redis_client.set(_redis_key(key), _encode(credentials), ex=ttl)
+        except redis.RedisError as e:
+            logger.warning("Credential cache write failed: %s", e)
+    return credentials
+
+
+async def invalidate(username=None, email=None, phone_number=None):
+    """Drop cached entries for a user's identifiers, e.g. after registration or a password change."""
+    await invalidate_many([(username, email, phone_number)])
+
+
+async def invalidate_many(identifier_rows):
+    keys = [
+        _cache_key(field, identifiers.normalize(field, value))
+        for user_identifiers in identifier_rows
+        for field, value in zip(LOOKUP_FIELDS, user_identifiers)
+        if value is not None
+    ]
+    if not keys:
+        return
+    if not database_setup.replicas:
+        for key in keys:
+            _local_cache.delete(key)
+        redis_client = redis_setup.redis_info()
+        if redis_client:
+            try:
+                await redis_client.delete(*[_redis_key(key) for key in keys])
+            except redis.RedisError as e:
+                logger.warning("Credential cache invalidation failed: %s", e)
+        return
+
+    # with replicas, pin the identifiers to the primary for the lag window
+    # instead of dropping them, a replica may not have the write yet
+    pin_ttl = max(1, math.ceil(database_setup.DB_REPLICA_LAG_SECONDS))
+    for key in keys:
+        _local_cache.set(key, PRIMARY_PIN, pin_ttl)
+    redis_client = redis_setup.redis_info()
+    if redis_client:
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.set(_redis_key(key), PRIMARY_PIN, ex=pin_ttl)
+                await pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("Credential cache invalidation failed: %s", e)
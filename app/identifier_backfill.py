@@ -0,0 +1,148 @@
+"""Fill the normalised identifier columns of existing users.
+
+    python -m app.identifier_backfill --batch-size 1000 --pause 0.1
+
+Walks the users table in id order, one short transaction per batch, and
+can be stopped and rerun at any time. A row whose normalised value is
+already taken by another account (Foo@x.com next to foo@x.com) is left
+NULL and logged; it keeps matching as typed until resolved.
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import IntegrityError
+
+from models.users import Users
+from app import identifiers
+from setup import database_setup, logging_setup
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+IDENTIFIER_BACKFILL_BATCH_SIZE = int(os.getenv("IDENTIFIER_BACKFILL_BATCH_SIZE", 1000))
+# seconds between batches, keeps the load on the primary and the
+# replication stream flat
+IDENTIFIER_BACKFILL_PAUSE = float(os.getenv("IDENTIFIER_BACKFILL_PAUSE", 0.1))
+IDENTIFIER_BACKFILL_MAX_ATTEMPTS = 3
+
+FIELDS = tuple(identifiers.NORMALIZED_COLUMNS.items())
+
+
+def _missing(field, normalized_field):
+    return getattr(Users, normalized_field).is_(None) & getattr(Users, field).isnot(None)
+
+
+async def _pending_rows(db, after_id, batch_size):
+    statement = (
+        select(Users.id, *(getattr(Users, field) for field, _ in FIELDS),
+               *(getattr(Users, normalized_field) for _, normalized_field in FIELDS))
+        .where(Users.id > after_id)
+        .where(_missing(*FIELDS[0]) | _missing(*FIELDS[1]) | _missing(*FIELDS[2]))
+        .order_by(Users.id)
+        .limit(batch_size)
+    )
+    return (await db.execute(statement)).all()
+
+
+async def _plan(db, rows):
+    """Return {normalized_field: [(user id, value)]} to write, and the conflicts."""
+    updates = {}
+    conflicts = []
+    for index, (field, normalized_field) in enumerate(FIELDS):
+        candidates = {}
+        for row in rows:
+            raw, current = row[1 + index], row[1 + len(FIELDS) + index]
+            if raw is None or current is not None:
+                continue
+            value = identifiers.normalize(field, raw)
+            # the oldest account keeps an identifier claimed twice in one batch
+            if value in candidates:
+                conflicts.append((row[0], field, value))
+            else:
+                candidates[value] = row[0]
+        if not candidates:
+            continue
+        column = getattr(Users, normalized_field)
+        taken = set((await db.execute(select(column).where(column.in_(list(candidates))))).scalars())
+        for value in taken:
+            conflicts.append((candidates.pop(value), field, value))
+        updates[normalized_field] = [(user_id, value) for value, user_id in candidates.items()]
+    return updates, conflicts
+
+
+async def _apply(db, updates):
+    table = Users.__table__
+    for normalized_field, values in updates.items():
+        if not values:
+            continue
+        statement = (
+            table.update()
+            .where(table.c.id == bindparam("row_id"))
+            .where(table.c[normalized_field].is_(None))
+            .values({normalized_field: bindparam("value")})
+        )
+        await db.execute(statement, [{"row_id": user_id, "value": value} for user_id, value in values])
+
+
+async def backfill_batch(db, rows, dry_run=False):
+    """Normalise one batch of rows; returns (rows updated, conflicts)."""
+    for attempt in range(1, IDENTIFIER_BACKFILL_MAX_ATTEMPTS + 1):
+        updates, conflicts = await _plan(db, rows)
+        if dry_run:
+            await db.rollback()
+            return len({user_id for values in updates.values() for user_id, _ in values}), conflicts
+        try:
+            await _apply(db, updates)
+            await db.commit()
+            return len({user_id for values in updates.values() for user_id, _ in values}), conflicts
+        except IntegrityError:
+            # a registration claimed one of the values since it was planned
+            await db.rollback()
+            if attempt == IDENTIFIER_BACKFILL_MAX_ATTEMPTS:
+                raise
+            logger.info("Backfill batch raced with a write, replanning")
+
+
+async def backfill(batch_size=IDENTIFIER_BACKFILL_BATCH_SIZE, pause=IDENTIFIER_BACKFILL_PAUSE, dry_run=False):
+    summary = {"updated": 0, "conflicts": 0}
+    last_id = 0
+    async with database_setup.session_local() as db:
+        while True:
+            rows = await _pending_rows(db, last_id, batch_size)
+            if not rows:
+                break
+            updated, conflicts = await backfill_batch(db, rows, dry_run)
+            for user_id, field, value in conflicts:
+                logger.warning("User %s: normalised %s %s already belongs to another account", user_id, field, value)
+            summary["updated"] += updated
+            summary["conflicts"] += len(conflicts)
+            last_id = rows[-1][0]
+            logger.info("Backfilled identifiers up to user id %s: %s", last_id, summary)
+            await asyncio.sleep(pause)
+    return summary
+
+
+async def _main(args):
+    try:
+        summary = await backfill(args.batch_size, args.pause, args.dry_run)
+        logger.info("Identifier backfill finished: %s", summary)
+    finally:
+        await database_setup.close_engine()
+
+
+def main():
+    logging_setup.configure_logging()
+    parser = argparse.ArgumentParser(description="Fill the normalised identifier columns of existing users.")
+    parser.add_argument("--batch-size", type=int, default=IDENTIFIER_BACKFILL_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=IDENTIFIER_BACKFILL_PAUSE, help="seconds between batches")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be written and the conflicts")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import re
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# country code for numbers given in national format, e.g. 0664 123 4567
+PHONE_DEFAULT_COUNTRY_CODE = os.getenv("PHONE_DEFAULT_COUNTRY_CODE", "43")
+
+# login field -> column holding its normalised form
+NORMALIZED_COLUMNS = {
+    "username": "username_normalized",
+    "email": "email_normalized",
+    "phone_number": "phone_normalized",
+}
+
+_phone_separators = re.compile(r"[\s\-./()]")
+
+
+def normalize_username(value):
+    return value.strip().lower()
+
+
+def normalize_email(value):
+    return value.strip().lower()
+
+
+def _phone_digits(value):
+    number = _phone_separators.sub("", value.strip())
+    if number.startswith("00"):
+        number = "+" + number[2:]
+    if number.startswith("+"):
+        return number[1:]
+    if number.startswith("0"):
+        return PHONE_DEFAULT_COUNTRY_CODE + number[1:]
+    return number
+
+
+def normalize_phone(value):
+    """E.164 form of a phone number; values that don't parse are only stripped."""
+    digits = _phone_digits(value)
+    if not digits.isdigit() or not 8 <= len(digits) <= 15:
+        return value.strip()
+    return "+" + digits
+
+
+def normalize_prefix(field, prefix):
+    """Normalise the start of an identifier, for prefix search on the normalised columns."""
+    if field == "phone_number":
+        digits = _phone_digits(prefix)
+        return "+" + digits if digits.isdigit() else prefix.strip()
+    return normalize(field, prefix)
+
+
+_normalizers = {
+    "username": normalize_username,
+    "email": normalize_email,
+    "phone_number": normalize_phone,
+}
+
+
+def normalize(field, value):
+    return None if value is None else _normalizers[field](value)
+
+
+def normalized_columns(username=None, email=None, phone_number=None):
+    """Column values to store alongside a user's identifiers."""
+    return {
+        "username_normalized": normalize("username", username),
+        "email_normalized": normalize("email", email),
+        "phone_normalized": normalize("phone_number", phone_number),
+    }
@@ -0,0 +1,77 @@
+import os
+import secrets
+import logging
+from dotenv import load_dotenv
+from setup.metrics_setup import timed_stage
+from setup.redis_setup import LuaScript
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+OTP_LENGTH = 6
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", 90))
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", 5))
+
+# consume results
+CONSUMED = 1
+MISMATCH = 0
+MISSING = -1
+LOCKED = -2
+
+# Compare-and-delete in one round trip. Wrong guesses are counted in a
+# sibling key that shares the OTP's remaining TTL; once OTP_MAX_ATTEMPTS
+# is reached the OTP is burned so it can't be brute forced.
+CONSUME_SCRIPT = """
+local stored = redis.call('GET', KEYS[1])
+if not stored then
+    return -1
+end
+if stored == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+local attempts = redis.call('INCR', KEYS[2])
+if attempts == 1 then
+    local ttl = redis.call('PTTL', KEYS[1])
+    if ttl > 0 then
+        redis.call('PEXPIRE', KEYS[2], ttl)
+    end
+end
+if attempts >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return -2
+end
+return 0
+"""
+_consume_script = LuaScript(CONSUME_SCRIPT)
+
+
+def otp_key(phone_number):
+    return f"otp:{phone_number}"
+
+
+def attempts_key(phone_number):
+    return f"otp:{phone_number}:attempts"
+
+
+def generate_otp():
+    return ''.join(str(secrets.randbelow(10)) for _ in range(OTP_LENGTH))
+
+
+@timed_stage("otp_issue")
+async def issue(redis_client, phone_number, otp, ttl=OTP_TTL_SECONDS):
+    # SET NX EX: only one OTP per phone number can be live at a time
+    created = await redis_client.set(otp_key(phone_number), otp, nx=True, ex=ttl)
+    return bool(created)
+
+
+async def revoke(redis_client, phone_number):
+    await redis_client.delete(otp_key(phone_number), attempts_key(phone_number))
+
+
+@timed_stage("otp_consume")
+async def consume(redis_client, phone_number, otp, max_attempts=OTP_MAX_ATTEMPTS):
+    result = await _consume_script(redis_client, keys=[otp_key(phone_number), attempts_key(phone_number)],
+                                   args=[otp, max_attempts])
+    return int(result)
@@ -0,0 +1,159 @@
+import logging
+import math
+import os
+import time
+from typing import NamedTuple
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request, status
+
+from app import identifiers
+from app.local_cache import LocalCache, MISSING
+from setup import redis_setup
+from setup.metrics_setup import timed_stage
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+
+class Limit(NamedTuple):
+    requests: int
+    window: int
+
+
+def parse_limit(value):
+    # "<requests>/<window seconds>", e.g. "10/60"
+    requests, window = value.split("/")
+    return Limit(int(requests), int(window))
+
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_IP = parse_limit(os.getenv("RATE_LIMIT_IP", "30/60"))
+RATE_LIMIT_IDENTIFIER = parse_limit(os.getenv("RATE_LIMIT_IDENTIFIER", "10/60"))
+RATE_LIMIT_GLOBAL = parse_limit(os.getenv("RATE_LIMIT_GLOBAL", "500/1"))
+# budgets of the routes outside login, kept apart from RATE_LIMIT_IP so
+# a signup form checking names as they are typed can't lock out logins
+RATE_LIMIT_AVAILABILITY = parse_limit(os.getenv("RATE_LIMIT_AVAILABILITY", "120/60"))
+RATE_LIMIT_REFRESH = parse_limit(os.getenv("RATE_LIMIT_REFRESH", "30/60"))
+# only enable behind a proxy that sets the header, clients can forge it
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+LOCAL_WINDOWS_MAX_KEYS = 100000
+
+# per-worker counters used while Redis is unavailable: key -> [count];
+# least recently used windows go first, so rotating identifiers can't
+# grow it without bound
+_local_windows = LocalCache(LOCAL_WINDOWS_MAX_KEYS)
+
+
+def _client_ip(request):
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _window_keys(key, limit, now):
+    window_index = int(now // limit.window)
+    return f"rl:{key}:{window_index}", f"rl:{key}:{window_index - 1}"
+
+
+async def _redis_counts(redis_client, checks, now):
+    # INCR + EXPIRE + GET per check, all in a single round trip
+    pipe = redis_client.pipeline(transaction=False)
+    for key, limit in checks:
+        current_key, previous_key = _window_keys(key, limit, now)
+        pipe.incr(current_key)
+        pipe.expire(current_key, limit.window * 2)
+        pipe.get(previous_key)
+    values = await pipe.execute()
+    return [(int(values[i * 3]), int(values[i * 3 + 2] or 0)) for i in range(len(checks))]
+
+
+def _local_counts(checks, now):
+    counts = []
+    for key, limit in checks:
+        current_key, previous_key = _window_keys(key, limit, now)
+        entry = _local_windows.get(current_key)
+        if entry is MISSING:
+            entry = [0]
+            _local_windows.set(current_key, entry, limit.window * 2)
+        entry[0] += 1
+        previous = _local_windows.get(previous_key)
+        counts.append((entry[0], 0 if previous is MISSING else previous[0]))
+    return counts
+
+
+def _retry_after(limit, current, previous, now):
+    elapsed = now % limit.window
+    if previous and current < limit.requests:
+        # when the previous window's weight has decayed enough
+        wait = limit.window * (1 - (limit.requests - current) / previous) - elapsed
+    else:
+        wait = limit.window - elapsed
+    return max(1, math.ceil(wait))
+
+
+@timed_stage("rate_limit")
+async def enforce(checks):
+    """Count one hit against each (key, Limit) and raise 429 if any sliding window is exceeded."""
+    now = time.time()
+    counts = None
+    redis_client = redis_setup.redis_info()
+    if redis_client:
+        try:
+            counts = await _redis_counts(redis_client, checks, now)
+        except redis.RedisError as e:
+            logger.warning("Rate limiter falling back to local counters: %s", e)
+    if counts is None:
+        counts = _local_counts(checks, now)
+
+    for (key, limit), (current, previous) in zip(checks, counts):
+        elapsed = now % limit.window
+        weighted = previous * (1 - elapsed / limit.window) + current
+        if weighted > limit.requests:
+            retry_after = _retry_after(limit, current, previous, now)
+            logger.warning("Rate limit exceeded for %s, retry after %ss", key, retry_after, extra={"sampled": True})
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail={"message":"Too many requests, please try again later."},
+                                headers={"Retry-After": str(retry_after)})
+
+
+def limit_client(name, limit):
+    """Dependency limiting a route globally and per client IP, on its own per-IP budget."""
+
+    async def dependency(request: Request):
+        if not RATE_LIMIT_ENABLED:
+            return
+        await enforce([
+            (f"global:{request.url.path}", RATE_LIMIT_GLOBAL),
+            (f"{name}:ip:{_client_ip(request)}", limit),
+        ])
+
+    return dependency
+
+
+def limit_login(identifier_field):
+    """Dependency limiting a login route globally, per client IP and per value of identifier_field."""
+
+    async def dependency(request: Request):
+        if not RATE_LIMIT_ENABLED:
+            return
+        checks = [
+            (f"global:{request.url.path}", RATE_LIMIT_GLOBAL),
+            (f"ip:{_client_ip(request)}", RATE_LIMIT_IP),
+        ]
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+        identifier = payload.get(identifier_field) if isinstance(payload, dict) else None
+        if isinstance(identifier, str) and identifier.strip():
+            # normalised, so reformatting an identifier doesn't reset its limit
+            checks.append((f"{request.url.path}:{identifier_field}:{identifiers.normalize(identifier_field, identifier)}",
+                           RATE_LIMIT_IDENTIFIER))
+        await enforce(checks)
+
+    return dependency
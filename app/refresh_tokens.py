@@ -0,0 +1,103 @@
+import hashlib
+import logging
+import os
+import secrets
+
+from dotenv import load_dotenv
+
+from setup.metrics_setup import timed_stage
+from setup.redis_setup import LuaScript
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+REFRESH_TOKEN_TTL_SECONDS = int(os.getenv("REFRESH_TOKEN_TTL_SECONDS", 30 * 24 * 3600))
+
+# rotate results
+ROTATED = 1
+INVALID = 0
+REUSED = -1
+
+# A refresh token is "<family>.<secret>". Only sha256(secret) is stored.
+# Each use swaps the token for a new one in the same family and leaves a
+# "used" marker; presenting a used token again means it leaked, so the
+# whole family is revoked.
+ROTATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return {0, false}
+end
+local user_id = redis.call('GET', KEYS[1])
+if not user_id then
+    if redis.call('EXISTS', KEYS[2]) == 1 then
+        redis.call('SET', KEYS[3], 1, 'EX', ARGV[1])
+        return {-1, false}
+    end
+    return {0, false}
+end
+redis.call('DEL', KEYS[1])
+redis.call('SET', KEYS[2], 1, 'EX', ARGV[1])
+redis.call('SET', KEYS[4], user_id, 'EX', ARGV[1])
+return {1, user_id}
+"""
+_rotate_script = LuaScript(ROTATE_SCRIPT)
+
+
+def _split(token):
+    family, _, secret = token.partition(".")
+    if not family or not secret:
+        return None, None
+    return family, hashlib.sha256(secret.encode()).hexdigest()
+
+
+def token_key(family, digest):
+    return f"refresh:{family}:{digest}"
+
+
+def used_key(family, digest):
+    return f"refresh:{family}:{digest}:used"
+
+
+def revoked_family_key(family):
+    return f"refresh:{family}:revoked"
+
+
+def _new_token(family):
+    secret = secrets.token_urlsafe(32)
+    return f"{family}.{secret}", hashlib.sha256(secret.encode()).hexdigest()
+
+
+@timed_stage("refresh_issue")
+async def issue(redis_client, user_id):
+    family = secrets.token_hex(8)
+    token, digest = _new_token(family)
+    await redis_client.set(token_key(family, digest), user_id, ex=REFRESH_TOKEN_TTL_SECONDS)
+    return token
+
+
+@timed_stage("refresh_rotate")
+async def rotate(redis_client, token):
+    """Return (ROTATED, user_id, new token), or (INVALID or REUSED, None, None)."""
+    family, digest = _split(token)
+    if family is None:
+        return INVALID, None, None
+    new_token, new_digest = _new_token(family)
+    result, user_id = await _rotate_script(
+        redis_client,
+        keys=[token_key(family, digest), used_key(family, digest),
+              revoked_family_key(family), token_key(family, new_digest)],
+        args=[REFRESH_TOKEN_TTL_SECONDS],
+    )
+    if result != ROTATED:
+        if result == REUSED:
+            logger.warning("Refresh token reuse detected, family %s revoked", family)
+        return int(result), None, None
+    return ROTATED, int(user_id), new_token
+
+
+async def revoke_family(redis_client, token):
+    family, digest = _split(token)
+    if family is None:
+        return
+    await redis_client.set(revoked_family_key(family), 1, ex=REFRESH_TOKEN_TTL_SECONDS)
+    await redis_client.delete(token_key(family, digest))
@@ -1,28 +1,39 @@
-from fastapi import APIRouter
-from passlib.context import CryptContext
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from models.users import Users, UserCreate
-from starlette.responses import JSONResponse
+from starlette.responses import StreamingResponse
+from setup.response_setup import ORJSONResponse
 from setup.database_setup import get_db
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from setup import audit_setup, hashing_setup, metrics_setup
+from app import admin_users, availability, bulk_register, credential_cache, identifiers, rate_limit
+import json
 import logging
+import tempfile
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
-router = APIRouter()
-
-
-db =  next(get_db())
+router = APIRouter(prefix="/api")
 
 @router.post("/register")
-def register_user(data: UserCreate):
+async def register_user(data: UserCreate, db: AsyncSession = Depends(get_db)):
     try:
         data = dict(data)
-        logger.info(f"Starting user registration process.with data: {data}")
+        logger.info("Starting user registration process for username: %s", data.get("username"))
+        
+        # known duplicates are turned away before paying for the hash
+        taken = await availability.taken_fields(db, data.get("username"), data.get("email"), data.get("phone_number"))
+        if taken:
+            logger.error("User registration rejected, %s already taken", ", ".join(taken))
+            audit_setup.emit(audit_setup.REGISTRATION, audit_setup.FAILURE, identifier=data.get("username"),
+                             reason="duplicate", fields=taken)
+            return ORJSONResponse(
+                status_code=400,
+                content={"message": "User with this info:(email or username or phone number) already exists."},
+            )
         
         # Hash the password
-        password = pwd_context.hash(data.get("password"))
+        password = await hashing_setup.hash_password(data.get("password"))
         
         #prepare user info for registration
         registeration_info = {
@@ -31,36 +42,94 @@ def register_user(data: UserCreate):
             "username": data.get("username"),
             "email": data.get("email"),
             "phone_number": data.get("phone_number"),
+            **identifiers.normalized_columns(data.get("username"), data.get("email"), data.get("phone_number")),
             "password": password,
             "active_status": True,
         }
         # Create user instance and add to the database
         create_user = Users(**registeration_info)
-        db.add(create_user)
-        db.commit()
-        db.refresh(create_user)
+        with metrics_setup.stage("db_user_insert"):
+            db.add(create_user)
+            await db.commit()
+            await db.refresh(create_user)
+        await credential_cache.invalidate(data.get("username"), data.get("email"), data.get("phone_number"))
+        availability.add(data.get("username"), data.get("email"), data.get("phone_number"))
         
-        logger.info(f"User registered successfully with username: {data.get('username')}")
+        logger.info("User registered successfully with username: %s", data.get('username'))
+        audit_setup.emit(audit_setup.REGISTRATION, audit_setup.SUCCESS, create_user.id, data.get("username"))
         
         if create_user:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=201,
                 content={"message": "User registered successfully."},
             )
         else:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=400,
                 content={"message": "User registration is failed."},
             )
+    except HTTPException:
+        raise
     except IntegrityError:
+        await db.rollback()
         logger.error("User registration failed due to integrity error (duplicate entry) for data:(email or username or phone number)")
-        return JSONResponse(
+        audit_setup.emit(audit_setup.REGISTRATION, audit_setup.FAILURE, identifier=data.get("username"), reason="duplicate")
+        return ORJSONResponse(
             status_code=400,
             content={"message": "User with this info:(email or username or phone number) already exists."},
         )
     except Exception as e:
-        logger.error(f"User registration failed due to an unexpected error: {str(e)}")
-        return JSONResponse(
+        logger.error("User registration failed due to an unexpected error: %s", e)
+        return ORJSONResponse(
             status_code=500,
             content={"message": f"An error occurred: {str(e)}"},
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/register/available", dependencies=[Depends(rate_limit.limit_client("avail", rate_limit.RATE_LIMIT_AVAILABILITY))])
+async def register_available(username: str | None = None, email: str | None = None,
+                             phone_number: str | None = None, db: AsyncSession = Depends(get_db)):
+    requested = {field: value for field, value in
+                 zip(availability.FIELDS, (username, email, phone_number)) if value is not None}
+    if not requested:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail={"message": "username, email or phone_number is required."})
+    taken = await availability.taken_fields(db, **requested)
+    return {field: field not in taken for field in requested}
+
+
+def _body_too_large():
+    return HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                         detail={"message": f"Request body exceeds {bulk_register.BULK_MAX_BODY_BYTES} bytes."})
+
+
+@router.post("/register/bulk", dependencies=[Depends(admin_users.require_admin_token)])
+async def bulk_register_users(request: Request):
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > bulk_register.BULK_MAX_BODY_BYTES:
+        raise _body_too_large()
+    # the body is spooled before streaming results back, so reading the
+    # request never competes with writing the response
+    spool = tempfile.SpooledTemporaryFile(max_size=bulk_register.BULK_SPOOL_MAX_MEMORY)
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > bulk_register.BULK_MAX_BODY_BYTES:
+            # chunked bodies carry no Content-Length to check up front
+            spool.close()
+            raise _body_too_large()
+        spool.write(chunk)
+    spool.seek(0)
+    logger.info("Starting bulk user registration")
+
+    async def results():
+        try:
+            async for result in bulk_register.register_stream(spool):
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            logger.error("Bulk registration aborted due to an unexpected error: %s", e)
+            yield json.dumps({"status": "aborted", "errors": ["An unexpected error occurred."]}) + "\n"
+        finally:
+            spool.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
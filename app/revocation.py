@@ -0,0 +1,106 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+from setup import redis_setup
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+REVOCATION_RETRY_SECONDS = float(os.getenv("REVOCATION_RETRY_SECONDS", 1))
+
+# sorted set of revoked access token ids scored by the token's exp, so
+# entries can be dropped once the token would have expired anyway
+REVOKED_KEY = "revoked:jti"
+REVOCATION_CHANNEL = "revocations"
+
+# per-worker mirror, jti -> exp; only holds tokens that haven't expired
+_revoked = {}
+# (exp, jti) heap over _revoked, so pruning only looks at expired entries
+_expiries = []
+_listener_task = None
+
+
+def is_revoked(jti):
+    return jti in _revoked
+
+
+def _prune(now):
+    while _expiries and _expiries[0][0] <= now:
+        _, jti = heapq.heappop(_expiries)
+        if _revoked.get(jti, now) <= now:
+            _revoked.pop(jti, None)
+
+
+def _remember(jti, exp):
+    now = time.time()
+    _prune(now)
+    # a worker hears its own revocations back on the channel
+    if exp > now and _revoked.get(jti) != exp:
+        _revoked[jti] = exp
+        heapq.heappush(_expiries, (exp, jti))
+
+
+async def revoke(jti, exp):
+    """Deny an access token until its exp, on every worker."""
+    redis_client = redis_setup.redis_info()
+    if not redis_client:
+        raise redis_setup.redis_breaker.unavailable()
+    _remember(jti, exp)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.zadd(REVOKED_KEY, {jti: exp})
+        pipe.zremrangebyscore(REVOKED_KEY, "-inf", time.time())
+        pipe.publish(REVOCATION_CHANNEL, f"{jti}:{exp}")
+        await pipe.execute()
+
+
+async def _load(redis_client):
+    entries = await redis_client.zrangebyscore(REVOKED_KEY, time.time(), "+inf", withscores=True)
+    _revoked.clear()
+    _revoked.update(entries)
+    _expiries[:] = [(exp, jti) for jti, exp in entries]
+    heapq.heapify(_expiries)
+    logger.info("Loaded %s revoked tokens", len(_revoked))
+
+
+async def _listen():
+    while True:
+        redis_client = redis_setup.redis_info()
+        if redis_client is None:
+            await asyncio.sleep(REVOCATION_RETRY_SECONDS)
+            continue
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(REVOCATION_CHANNEL)
+            # loaded after subscribing, so nothing published in between is missed
+            await _load(redis_client)
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                jti, exp = message["data"].rsplit(":", 1)
+                _remember(jti, float(exp))
+        except (redis.RedisError, OSError) as e:
+            logger.warning("Revocation listener lost Redis, resubscribing: %s", e)
+            await asyncio.sleep(REVOCATION_RETRY_SECONDS)
+        finally:
+            await pubsub.aclose()
+
+
+def start():
+    global _listener_task
+    if _listener_task is None:
+        _listener_task = asyncio.create_task(_listen())
+
+
+async def stop():
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        await asyncio.gather(_listener_task, return_exceptions=True)
+        _listener_task = None
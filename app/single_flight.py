@@ -0,0 +1,125 @@
+import asyncio
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+from setup import redis_setup
+from setup.metrics_setup import SINGLE_FLIGHT_CALLS
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# also coalesce across workers through a short Redis lock; keys are only
+# comparable between workers when they share SINGLE_FLIGHT_SECRET
+SINGLE_FLIGHT_SECRET = os.getenv("SINGLE_FLIGHT_SECRET", "")
+SINGLE_FLIGHT_REDIS = os.getenv("SINGLE_FLIGHT_REDIS", "false").lower() == "true" and bool(SINGLE_FLIGHT_SECRET)
+# longer than the slowest leader (an argon2 verify under load), shorter
+# than a client's retry timeout
+SINGLE_FLIGHT_LOCK_MS = int(os.getenv("SINGLE_FLIGHT_LOCK_MS", 3000))
+SINGLE_FLIGHT_RESULT_TTL_MS = int(os.getenv("SINGLE_FLIGHT_RESULT_TTL_MS", 1000))
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", 0.01))
+
+# releases the lock only if this flight still holds it, and publishes the
+# result for the workers waiting on it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+if ARGV[2] ~= '' then
+    redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[3])
+end
+return 1
+"""
+_release_script = redis_setup.LuaScript(RELEASE_SCRIPT)
+
+_inflight = {}
+_process_secret = secrets.token_bytes(32)
+
+
+def flight_key(*parts):
+    # an HMAC, so a key derived from a password reveals nothing about it
+    secret = SINGLE_FLIGHT_SECRET.encode() or _process_secret
+    return hmac.new(secret, "\0".join(parts).encode(), hashlib.sha256).hexdigest()
+
+
+async def _release(redis_client, lock_key, token, result_key, encoded):
+    try:
+        await _release_script(redis_client, keys=[lock_key, result_key], args=[token, encoded, SINGLE_FLIGHT_RESULT_TTL_MS])
+    except redis.RedisError as e:
+        logger.warning("Single-flight release failed: %s", e)
+
+
+async def _across_workers(operation, key, func):
+    redis_client = redis_setup.redis_info()
+    if not redis_client:
+        return await func()
+    lock_key = f"sf:{key}"
+    token = secrets.token_hex(8)
+    try:
+        if await redis_client.set(lock_key, token, nx=True, px=SINGLE_FLIGHT_LOCK_MS):
+            holder = token
+        else:
+            holder = await redis_client.get(lock_key)
+    except redis.RedisError as e:
+        logger.warning("Single-flight lock failed, running locally: %s", e)
+        return await func()
+
+    if holder == token:
+        encoded = ""
+        try:
+            result = await func()
+            encoded = json.dumps(result)
+            return result
+        finally:
+            await _release(redis_client, lock_key, token, f"sf:{key}:{token}", encoded)
+
+    # another worker is running it: wait for its result while it holds the lock
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SINGLE_FLIGHT_LOCK_MS / 1000
+    try:
+        while holder is not None and loop.time() < deadline:
+            raw, current_holder = await redis_client.mget(f"sf:{key}:{holder}", lock_key)
+            if raw is not None:
+                SINGLE_FLIGHT_CALLS.labels(operation, "remote").inc()
+                return json.loads(raw)
+            if current_holder != holder:
+                # finished without a result (it failed) or the lock expired
+                break
+            await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+    except redis.RedisError as e:
+        logger.warning("Single-flight wait failed, running locally: %s", e)
+    return await func()
+
+
+def _forget(key, task):
+    _inflight.pop(key, None)
+    # every caller may have gone away; don't log the error as unretrieved
+    if not task.cancelled():
+        task.exception()
+
+
+async def do(operation, key, func):
+    """Run func() once for concurrent callers with the same key and share the outcome.
+
+    The shared run is its own task, so a caller going away doesn't cancel
+    it for the others; exceptions are shared like results. With
+    SINGLE_FLIGHT_REDIS the result must be JSON serialisable, and comes
+    back from other workers as decoded JSON.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        SINGLE_FLIGHT_CALLS.labels(operation, "leader").inc()
+        task = asyncio.ensure_future(_across_workers(operation, key, func) if SINGLE_FLIGHT_REDIS else func())
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_forget, key))
+    else:
+        SINGLE_FLIGHT_CALLS.labels(operation, "shared").inc()
+    return await asyncio.shield(task)
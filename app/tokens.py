@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+
+import jwt
+import orjson
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jwt.algorithms import get_default_algorithms
+from starlette.responses import Response
+
+from app import revocation
+from app.local_cache import LocalCache, MISSING
+from setup.logging_setup import configure_logging
+from setup.metrics_setup import timed_stage
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+jwt_secret = os.getenv("SECRET")
+jwt_algorithm = os.getenv("ALGORITHM", "HS256")
+# ES256/EdDSA: one PEM file per key, named <kid>.pem. The active key signs,
+# the others only verify and stay published until their tokens expired.
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", "keys")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")
+JWKS_MAX_AGE = int(os.getenv("JWKS_MAX_AGE", 300))
+TOKEN_TTL_SECONDS = int(os.getenv("TOKEN_TTL_SECONDS", 900))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+
+ASYMMETRIC_ALGORITHMS = ("ES256", "EdDSA")
+
+bearer_scheme = HTTPBearer(auto_error=False)
+router = APIRouter()
+
+_signing_key = None
+_signing_headers = None
+# kid -> prepared public key; None holds the key for tokens without a kid
+_verification_keys = {}
+_jwks_body = b'{"keys":[]}'
+_jwks_etag = None
+# sha256(token) -> claims, kept until the token's own exp
+_verified_tokens = LocalCache(TOKEN_CACHE_SIZE)
+
+
+def _load_key_files(algorithm):
+    private_keys = {}
+    public_keys = {}
+    for path in sorted(Path(JWT_KEYS_DIR).glob("*.pem")):
+        pem = path.read_bytes()
+        if b"PRIVATE KEY" in pem:
+            private_keys[path.stem] = algorithm.prepare_key(pem)
+            public_keys[path.stem] = private_keys[path.stem].public_key()
+        else:
+            public_keys[path.stem] = algorithm.prepare_key(pem)
+    return private_keys, public_keys
+
+
+def _build_jwks(algorithm, public_keys):
+    keys = []
+    for kid, key in public_keys.items():
+        jwk = algorithm.to_jwk(key, as_dict=True)
+        jwk.update({"kid": kid, "alg": jwt_algorithm, "use": "sig"})
+        keys.append(jwk)
+    return orjson.dumps({"keys": keys})
+
+
+def load_keys():
+    # prepared once so encode/decode don't re-parse the key on every call
+    global _signing_key, _signing_headers, _verification_keys, _jwks_body, _jwks_etag
+    algorithm = get_default_algorithms()[jwt_algorithm]
+    if jwt_algorithm in ASYMMETRIC_ALGORITHMS:
+        private_keys, public_keys = _load_key_files(algorithm)
+        # without JWT_ACTIVE_KID the highest kid signs, e.g. the newest generate-key timestamp
+        kid = JWT_ACTIVE_KID or (max(private_keys) if private_keys else None)
+        if kid not in private_keys:
+            raise RuntimeError(f"no private key for kid {kid!r} in {JWT_KEYS_DIR}")
+        _signing_key = private_keys[kid]
+        _signing_headers = {"kid": kid}
+        _verification_keys = public_keys
+        _jwks_body = _build_jwks(algorithm, public_keys)
+    else:
+        _signing_key = algorithm.prepare_key(jwt_secret)
+        _signing_headers = {"kid": JWT_ACTIVE_KID} if JWT_ACTIVE_KID else None
+        _verification_keys = {JWT_ACTIVE_KID: _signing_key, None: _signing_key}
+        # a shared secret is never published
+        _jwks_body = b'{"keys":[]}'
+    _jwks_etag = '"%s"' % hashlib.sha256(_jwks_body).hexdigest()[:32]
+    _verified_tokens.clear()
+    logger.info("Token keys loaded for algorithm %s, signing with kid %s",
+                jwt_algorithm, (_signing_headers or {}).get("kid"))
+
+
+@timed_stage("token_creation")
+def create_token(user_id):
+    if _signing_key is None:
+        load_keys()
+    issued_at = int(time.time())
+    payload = {
+        "user_id": user_id,
+        "jti": uuid.uuid4().hex,
+        "iat": issued_at,
+        "exp": issued_at + TOKEN_TTL_SECONDS,
+    }
+    return jwt.encode(payload, _signing_key, algorithm=jwt_algorithm, headers=_signing_headers)
+
+
+@timed_stage("token_verification")
+def verify_token(token):
+    digest = hashlib.sha256(token.encode()).digest()
+    claims = _verified_tokens.get(digest)
+    if claims is not MISSING:
+        return claims
+    if _signing_key is None:
+        load_keys()
+    kid = jwt.get_unverified_header(token).get("kid")
+    key = _verification_keys.get(kid)
+    if key is None:
+        raise jwt.InvalidTokenError(f"unknown kid {kid!r}")
+    claims = jwt.decode(token, key, algorithms=[jwt_algorithm],
+                        options={"require": ["exp", "iat"]})
+    ttl = claims["exp"] - time.time()
+    if ttl > 0:
+        _verified_tokens.set(digest, claims, ttl)
+    return claims
+
+
+async def get_token_claims(credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme)):
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail={"message":"Not authenticated"},
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = verify_token(credentials.credentials)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail={"message":"Token has expired"},
+                            headers={"WWW-Authenticate": "Bearer"})
+    except jwt.InvalidTokenError as e:
+        logger.warning("Invalid token: %s", e)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail={"message":"Invalid token"},
+                            headers={"WWW-Authenticate": "Bearer"})
+    # in-memory check, kept in sync over pub/sub
+    if revocation.is_revoked(claims.get("jti")):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail={"message":"Token has been revoked"},
+                            headers={"WWW-Authenticate": "Bearer"})
+    return claims
+
+
+@router.get("/.well-known/jwks.json", include_in_schema=False)
+async def jwks(request: Request):
+    headers = {"Cache-Control": f"public, max-age={JWKS_MAX_AGE}", "ETag": _jwks_etag}
+    if request.headers.get("if-none-match") == _jwks_etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=_jwks_body, media_type="application/json", headers=headers)
+
+
+def generate_key(algorithm, kid, keys_dir):
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    if algorithm == "ES256":
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    path = Path(keys_dir) / f"{kid}.pem"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "xb") as key_file:
+        key_file.write(pem)
+    path.chmod(0o600)
+    return path
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Token signing key tools.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = subcommands.add_parser("generate-key", help="write a new private key to JWT_KEYS_DIR/<kid>.pem")
+    generate_parser.add_argument("--kid", default=time.strftime("%Y%m%d%H%M%S"))
+    generate_parser.add_argument("--algorithm", choices=ASYMMETRIC_ALGORITHMS, default=jwt_algorithm if jwt_algorithm in ASYMMETRIC_ALGORITHMS else "ES256")
+    generate_parser.add_argument("--dir", default=JWT_KEYS_DIR)
+    args = parser.parse_args()
+
+    path = generate_key(args.algorithm, args.kid, args.dir)
+    print(f"wrote {path}")
+    print(f"JWT_ACTIVE_KID={args.kid}")
+
+
+if __name__ == "__main__":
+    main()
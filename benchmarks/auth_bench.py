@@ -0,0 +1,294 @@
+"""Load test for the register/login/OTP endpoints.
+
+Builds the app with setup.base:create_app in process against SQLite (or
+--database-url, e.g. a disposable Postgres), fakeredis and the mock message
+provider, then reports throughput and p50/p95/p99 latency per endpoint and
+per stage:
+
+    python -m benchmarks.auth_bench --users 200 --concurrency 32
+    python -m benchmarks.auth_bench --save-baseline laptop
+    python -m benchmarks.auth_bench --compare laptop
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed=None):
+    values = sorted(samples)
+    summary = {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+    }
+    if elapsed:
+        summary["throughput_rps"] = round(len(values) / elapsed, 1)
+    return summary
+
+
+class Recorder:
+    def __init__(self):
+        self.endpoints = {}
+        self.stages = {}
+        self.status_codes = {}
+
+    def endpoint(self, name, duration_ms, status_code):
+        self.endpoints.setdefault(name, []).append(duration_ms)
+        codes = self.status_codes.setdefault(name, {})
+        codes[str(status_code)] = codes.get(str(status_code), 0) + 1
+
+    def stage(self, name, duration_ms):
+        self.stages.setdefault(name, []).append(duration_ms)
+
+
+def instrument_stages(recorder):
+    # wraps the functions each handler stage goes through; handlers look
+    # them up as module attributes, so replacing the attribute is enough
+    from app import credential_cache, otp_store, rate_limit, refresh_tokens, tokens
+    from setup import hashing_setup
+
+    stages = {
+        "rate_limit": (rate_limit, "enforce"),
+        "credential_lookup": (credential_cache, "get_credentials"),
+        "password_verify": (hashing_setup, "verify_and_update"),
+        "password_hash": (hashing_setup, "hash_password"),
+        "token_creation": (tokens, "create_token"),
+        "otp_issue": (otp_store, "issue"),
+        "otp_consume": (otp_store, "consume"),
+        "refresh_rotate": (refresh_tokens, "rotate"),
+    }
+    for name, (module, attribute) in stages.items():
+        original = getattr(module, attribute)
+        if inspect.iscoroutinefunction(original):
+            async def timed(*args, _original=original, _name=name, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await _original(*args, **kwargs)
+                finally:
+                    recorder.stage(_name, (time.perf_counter() - started) * 1000)
+        else:
+            def timed(*args, _original=original, _name=name, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return _original(*args, **kwargs)
+                finally:
+                    recorder.stage(_name, (time.perf_counter() - started) * 1000)
+        setattr(module, attribute, functools.wraps(original)(timed))
+
+
+def make_user(index, run_id):
+    return {
+        "first_name": "Bench",
+        "last_name": "User",
+        "username": f"bench_{run_id}_{index}",
+        "email": f"bench_{run_id}_{index}@example.com",
+        "password": f"password-{index}",
+        "phone_number": f"+43{run_id % 1000:03d}{index:08d}",
+    }
+
+
+async def timed_post(client, recorder, name, path, body):
+    started = time.perf_counter()
+    response = await client.post(path, json=body)
+    recorder.endpoint(name, (time.perf_counter() - started) * 1000, response.status_code)
+    return response
+
+
+async def run_phase(name, jobs, concurrency):
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async def worker():
+        while not queue.empty():
+            job = queue.get_nowait()
+            await job()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    print(f"{name}: {len(jobs)} flows in {elapsed:.2f}s", file=sys.stderr)
+    return elapsed
+
+
+async def run(args):
+    import fakeredis
+    import httpx
+    from setup import audit_setup, audit_sinks, database_setup, hashing_setup, message_dispatcher, redis_setup
+    from setup.base import create_app
+    from app import availability, tokens
+    from providers.mock_provider import MockMessageProvider
+
+    app = create_app()
+    recorder = Recorder()
+    instrument_stages(recorder)
+
+    async with database_setup.engine.begin() as connection:
+        await connection.run_sync(database_setup.Base.metadata.create_all)
+    fake_redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    hashing_setup.get_executor()
+    tokens.load_keys()
+    await redis_setup.init_redis(client=fake_redis)
+    message_dispatcher.start_dispatcher(MockMessageProvider())
+    availability.start()
+    await audit_setup.start_pipeline(audit_sinks.RedisStreamSink())
+
+    run_id = random.randint(0, 10**6)
+    users = [make_user(index, run_id) for index in range(args.users)]
+    transport = httpx.ASGITransport(app=app)
+    timings = {}
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            async def register(user):
+                await timed_post(client, recorder, "POST /api/register", "/api/register", user)
+
+            issued_refresh_tokens = []
+
+            async def login(user):
+                response = await timed_post(client, recorder, "POST /api/login", "/api/login",
+                                            {"username": user["username"], "password": user["password"]})
+                if response.status_code == 200 and response.json().get("refresh_token"):
+                    issued_refresh_tokens.append(response.json()["refresh_token"])
+
+            async def refresh(refresh_token):
+                await timed_post(client, recorder, "POST /api/token/refresh", "/api/token/refresh",
+                                 {"refresh_token": refresh_token})
+
+            async def login_email(user):
+                await timed_post(client, recorder, "POST /api/login/email", "/api/login/email",
+                                 {"email": user["email"], "password": user["password"]})
+
+            async def login_phone(user):
+                response = await timed_post(client, recorder, "POST /api/login/otp", "/api/login/otp",
+                                            {"phone_number": user["phone_number"]})
+                if response.status_code >= 400:
+                    return
+                otp = await fake_redis.get(f"otp:{user['phone_number']}")
+                await timed_post(client, recorder, "POST /api/login/phone", "/api/login/phone",
+                                 {"phone_number": user["phone_number"], "otp": otp or ""})
+
+            timings["register"] = await run_phase(
+                "register", [functools.partial(register, user) for user in users], args.concurrency)
+            logins = [random.choice(users) for _ in range(args.logins)]
+            timings["login"] = await run_phase(
+                "login", [functools.partial(login, user) for user in logins], args.concurrency)
+            # the cheap re-authentication path next to the argon2 one
+            timings["refresh"] = await run_phase(
+                "refresh", [functools.partial(refresh, token) for token in issued_refresh_tokens], args.concurrency)
+            timings["login_email"] = await run_phase(
+                "login_email", [functools.partial(login_email, user) for user in logins], args.concurrency)
+            # one OTP per phone number is live at a time, so each user logs in once
+            timings["login_phone"] = await run_phase(
+                "login_phone", [functools.partial(login_phone, user) for user in users], args.concurrency)
+    finally:
+        await audit_setup.stop_pipeline()
+        await availability.stop()
+        await message_dispatcher.stop_dispatcher()
+        await redis_setup.close_redis()
+        hashing_setup.shutdown_executor()
+        await database_setup.close_engine()
+
+    phase_of = {
+        "POST /api/register": "register",
+        "POST /api/login": "login",
+        "POST /api/token/refresh": "refresh",
+        "POST /api/login/email": "login_email",
+        "POST /api/login/otp": "login_phone",
+        "POST /api/login/phone": "login_phone",
+    }
+    return {
+        "config": {"users": args.users, "logins": args.logins, "concurrency": args.concurrency,
+                   "hashing_pool_size": hashing_setup.HASHING_POOL_SIZE, "cpu_count": os.cpu_count()},
+        "endpoints": {
+            name: {
+                **summarize(samples, timings[phase_of[name]]),
+                "errors": sum(count for code, count in recorder.status_codes[name].items() if int(code) >= 400),
+                "status_codes": recorder.status_codes[name],
+            }
+            for name, samples in recorder.endpoints.items()
+        },
+        "stages": {name: summarize(samples) for name, samples in recorder.stages.items()},
+    }
+
+
+def print_report(results):
+    print(f"{'endpoint':<24}{'count':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in results["endpoints"].items():
+        print(f"{name:<24}{row['count']:>8}{row['errors']:>8}{row['throughput_rps']:>10}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}  {row['status_codes']}")
+    print(f"\n{'stage':<24}{'count':>8}{'p50 ms':>28}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in results["stages"].items():
+        print(f"{name:<24}{row['count']:>8}{row['p50_ms']:>28}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against a baseline and return the regressions beyond tolerance."""
+    regressions = []
+    for name, row in results["endpoints"].items():
+        base = baseline["endpoints"].get(name)
+        if not base:
+            continue
+        p99_change = (row["p99_ms"] - base["p99_ms"]) / base["p99_ms"] if base["p99_ms"] else 0
+        rps_change = (row["throughput_rps"] - base["throughput_rps"]) / base["throughput_rps"] if base["throughput_rps"] else 0
+        print(f"{name:<24} p99 {p99_change:+.1%}  throughput {rps_change:+.1%}")
+        if p99_change > tolerance or rps_change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ViennaPulse auth endpoints.")
+    parser.add_argument("--users", type=int, default=100, help="users registered, each also logs in once by OTP")
+    parser.add_argument("--logins", type=int, default=500, help="password logins per login endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--rate-limit", action="store_true", help="keep login rate limiting enabled")
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument("--save-baseline", metavar="NAME", help=f"store results in {BASELINE_DIR}/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a saved baseline, exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (default 0.2)")
+    args = parser.parse_args()
+
+    # the setup modules read their configuration at import time
+    workdir = tempfile.mkdtemp(prefix="vienna_pulse_bench_")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{workdir}/bench.db"
+    os.environ.setdefault("SECRET", "benchmark-secret-that-is-at-least-32-bytes")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    if not args.rate_limit:
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        (BASELINE_DIR / f"{args.save_baseline}.json").write_text(json.dumps(results, indent=2))
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
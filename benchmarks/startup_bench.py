@@ -0,0 +1,134 @@
+"""Startup time of the API.
+
+Measures, each over --runs fresh processes, the time to import setup.base
+and build the app, and the time from launching `python -m setup.server`
+until /health/ready answers 200, plus the per-dependency warm-up
+timings the worker reports and how long a graceful shutdown takes:
+
+    python -m benchmarks.startup_bench --runs 5 --workers 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+IMPORT_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import setup.base
+imported = time.perf_counter()
+setup.base.create_app()
+built = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "create_app_ms": (built - imported) * 1000}))
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(env):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def measure_server(env, workers, timeout):
+    import httpx
+
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "setup.server", "--host", "127.0.0.1",
+                                "--port", str(port), "--workers", str(workers)],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = None
+        while time.perf_counter() - started < timeout:
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/health/ready", timeout=1)
+                if response.status_code == 200:
+                    ready = response.json()
+                    break
+            except httpx.TransportError:
+                pass
+            time.sleep(0.02)
+        if ready is None:
+            raise RuntimeError(f"server not ready after {timeout}s")
+        result = {"ready_ms": (time.perf_counter() - started) * 1000,
+                  **{f"warm_up_{name}_ms": value for name, value in ready["startup_ms"].items()}}
+        stopping = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=timeout)
+        result["shutdown_ms"] = (time.perf_counter() - stopping) * 1000
+        return result
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+async def create_schema():
+    from setup import database_setup
+    import models.audit, models.users  # noqa: F401 registers the tables
+
+    async with database_setup.engine.begin() as connection:
+        await connection.run_sync(database_setup.Base.metadata.create_all)
+    await database_setup.engine.dispose()
+
+
+def summarize(results):
+    return {key: {"median": round(statistics.median(run[key] for run in results), 1),
+                  "min": round(min(run[key] for run in results), 1),
+                  "max": round(max(run[key] for run in results), 1)}
+            for key in results[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ViennaPulse startup time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="write the JSON results here")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="vienna_pulse_startup_")
+    env = dict(os.environ)
+    env["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{workdir}/startup.db"
+    env.setdefault("SECRET", "benchmark-secret-that-is-at-least-32-bytes")
+    env.setdefault("ALGORITHM", "HS256")
+    env.setdefault("AUDIT_SINK", "none")
+    env["PYTHONPATH"] = str(ROOT)
+    os.environ.update(DATABASE_URL=env["DATABASE_URL"])
+    asyncio.run(create_schema())
+
+    results = {
+        "config": {"runs": args.runs, "workers": args.workers, "cpu_count": os.cpu_count()},
+        "import": summarize([measure_import(env) for _ in range(args.runs)]),
+        "server": summarize([measure_server(env, args.workers, args.timeout) for _ in range(args.runs)]),
+    }
+    print(f"{'phase':<28}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for section in ("import", "server"):
+        for name, row in results[section].items():
+            print(f"{name:<28}{row['median']:>12}{row['min']:>10}{row['max']:>10}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Micro benchmark for the login request/response path without I/O.
+
+Compares the old handler prologue (dict copy, the hand-written
+login_validation loop, stdlib json response) with the request models
+validated in pydantic-core and orjson rendering:
+
+    python -m benchmarks.validation_bench --iterations 200000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from starlette.responses import JSONResponse
+
+from models.auth import LoginRequest
+from setup.response_setup import ORJSONResponse
+
+BODY = b'{"username": "annah", "password": "correct horse battery staple"}'
+TOKEN = {"token": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9." + "x" * 120, "token_type": "bearer", "user_id": 12345}
+
+
+async def legacy_login_validation(validation_dict):
+    # app.auth_validation.login_validation before the request models
+    message = []
+    for item in validation_dict:
+        if not validation_dict[item]:
+            message.append(f"{item} is required.")
+        elif not isinstance(validation_dict[item], str):
+            message.append(f"{item} must be string.")
+        elif validation_dict[item].strip() == "":
+            message.append(f"{item} is required.")
+    return message
+
+
+async def legacy(body):
+    data = dict(json.loads(body))
+    username = data.get("username", "")
+    password = data.get("password", "")
+    await legacy_login_validation({"username": username, "password": password})
+    return JSONResponse(TOKEN).body
+
+
+async def typed(body):
+    payload = LoginRequest.model_validate_json(body)
+    payload.username, payload.password
+    return ORJSONResponse(TOKEN).body
+
+
+async def run(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await fn(BODY)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare legacy and typed login validation.")
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    results = {}
+    for name, fn in (("legacy", legacy), ("typed", typed)):
+        asyncio.run(run(fn, args.iterations // 10))
+        results[name] = asyncio.run(run(fn, args.iterations))
+        print(f"{name:8} {results[name]:.2f} us/request")
+    print(f"speedup  {results['legacy'] / results['typed']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+from sqlalchemy import BigInteger, Column, DateTime, Integer, JSON, String
+from setup.database_setup import Base
+
+
+class AuditEvent(Base):
+    __tablename__ = "audit_events"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    # generated by the emitter, so redelivered events are inserted once
+    event_id = Column(String(32), unique=True, nullable=False)
+    event_type = Column(String, nullable=False, index=True)
+    outcome = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=True, index=True)
+    identifier = Column(String, nullable=True)
+    request_id = Column(String, nullable=True)
+    details = Column(JSON, nullable=True)
+    occurred_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,45 @@
+from pydantic import BaseModel, StrictStr, StringConstraints
+from typing import Annotated
+
+# same whitespace handling as UserCreate, so a login matches what register stored
+RequiredStr = Annotated[StrictStr, StringConstraints(strip_whitespace=True, min_length=1)]
+
+
+class LoginRequest(BaseModel):
+    username: RequiredStr
+    password: RequiredStr
+
+
+class EmailLoginRequest(BaseModel):
+    email: RequiredStr
+    password: RequiredStr
+
+
+class OtpRequest(BaseModel):
+    phone_number: RequiredStr
+
+
+class PhoneLoginRequest(BaseModel):
+    phone_number: RequiredStr
+    otp: RequiredStr
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: RequiredStr
+
+
+class LogoutRequest(BaseModel):
+    refresh_token: RequiredStr | None = None
+
+
+class TokenResponse(BaseModel):
+    token: str
+    token_type: str
+    user_id: int
+    expires_in: int
+    # left out when Redis is unavailable at login
+    refresh_token: str | None = None
+
+
+class MessageResponse(BaseModel):
+    message: str
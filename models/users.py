@@ -1,7 +1,7 @@
 
 
 from pydantic import BaseModel, EmailStr, StringConstraints
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index
 from typing import Annotated
 from datetime import datetime
 from setup.database_setup import Base
@@ -17,10 +17,29 @@ class Users(Base):
     password = Column(String, nullable=False)
     email = Column(String, unique=True, index=True, nullable=True)
     phone_number = Column(String, unique=True, index=True, nullable=True)
-    created_at = Column(DateTime, nullable=False, default=datetime.now())
-    updated_at = Column(DateTime, nullable=True, onupdate=datetime.now())
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    updated_at = Column(DateTime, nullable=True, onupdate=datetime.now)
     active_status = Column(Boolean, nullable=False, default="True")
-    
+    # lower-cased username/email and E.164 phone number, see app.identifiers
+    username_normalized = Column(String, nullable=True)
+    email_normalized = Column(String, nullable=True)
+    phone_normalized = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_users_username_normalized", "username_normalized", unique=True),
+        Index("ix_users_email_normalized", "email_normalized", unique=True),
+        Index("ix_users_phone_normalized", "phone_normalized", unique=True),
+        # keyset order of the admin listing
+        Index("ix_users_created_at_id", "created_at", "id"),
+        # byte-wise LIKE 'prefix%' whatever the database collation
+        Index("ix_users_username_prefix", "username_normalized",
+              postgresql_ops={"username_normalized": "varchar_pattern_ops"}),
+        Index("ix_users_email_prefix", "email_normalized",
+              postgresql_ops={"email_normalized": "varchar_pattern_ops"}),
+        Index("ix_users_phone_prefix", "phone_normalized",
+              postgresql_ops={"phone_normalized": "varchar_pattern_ops"}),
+    )
+
 NonEmptyStr = Annotated[str, StringConstraints(strip_whitespace=True, min_length=4)]
 NonEmptyStrPhone = Annotated[str, StringConstraints(strip_whitespace=True, min_length=11)]
 
@@ -34,6 +53,26 @@ class UserCreate(BaseModel):
     phone_number: NonEmptyStrPhone | None
 
 
+class UserAdminRead(BaseModel):
+    # what the admin API exposes, never the password hash
+    id: int
+    first_name: str
+    last_name: str
+    username: str | None
+    email: str | None
+    phone_number: str | None
+    active_status: bool
+    created_at: datetime
+    updated_at: datetime | None
+
+    model_config = {"from_attributes": True}
+
+
+class UserPage(BaseModel):
+    items: list[UserAdminRead]
+    next_cursor: str | None
+
+
 class UserRead(UserCreate):
     id: int
     first_name: str
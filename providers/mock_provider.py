@@ -1,6 +1,10 @@
 from setup.message_setup import BaseMessageProvider
 
 class MockMessageProvider(BaseMessageProvider):
+    name = "mock"
+    supports_batch = True
+    max_batch_size = 100
+
     async def send_message(self, to: str, message: str) -> dict:
         return {
             "status": "success",
@@ -8,4 +12,5 @@ class MockMessageProvider(BaseMessageProvider):
             "to": to,
             "message": message,
             "description": "Message NOT actually sent. This is a mock provider."
-        }
\ No newline at end of file
+        }
+
@@ -0,0 +1,266 @@
+"""Moves audit events from the sink into the audit_events table.
+
+    python -m setup.audit_service_runner            # source from AUDIT_SINK
+    python -m setup.audit_service_runner --source file
+
+Events are acknowledged only after their batch is committed, and inserts
+skip event_ids already stored, so a crash between the two is harmless.
+Stream entries that can't be parsed, or that failed AUDIT_MAX_DELIVERIES
+times, are moved to AUDIT_DEAD_LETTER_STREAM instead of being retried forever.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime
+
+import orjson
+import redis.asyncio as redis
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from models.audit import AuditEvent
+from setup import audit_setup, audit_sinks, database_setup, logging_setup, redis_setup
+from setup.metrics_setup import AUDIT_EVENTS
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+AUDIT_CONSUMER_GROUP = os.getenv("AUDIT_CONSUMER_GROUP", "audit-writers")
+AUDIT_CONSUMER_NAME = os.getenv("AUDIT_CONSUMER_NAME", f"{socket.gethostname()}-{os.getpid()}")
+# pending stream entries idle this long were left by a crashed runner
+AUDIT_CLAIM_IDLE_MS = int(os.getenv("AUDIT_CLAIM_IDLE_MS", 60000))
+AUDIT_POLL_SECONDS = float(os.getenv("AUDIT_POLL_SECONDS", 1))
+# attempts at storing a stream entry before it's dead-lettered
+AUDIT_MAX_DELIVERIES = int(os.getenv("AUDIT_MAX_DELIVERIES", 5))
+AUDIT_DEAD_LETTER_STREAM = os.getenv("AUDIT_DEAD_LETTER_STREAM", f"{audit_sinks.AUDIT_STREAM}:dead")
+
+
+class RedisStreamSource:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+
+    async def start(self):
+        try:
+            await self.redis_client.xgroup_create(audit_sinks.AUDIT_STREAM, AUDIT_CONSUMER_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _dead_letter(self, entry_id, fields, reason):
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.xadd(AUDIT_DEAD_LETTER_STREAM, {**fields, "entry_id": entry_id, "reason": reason})
+            pipe.xack(audit_sinks.AUDIT_STREAM, AUDIT_CONSUMER_GROUP, entry_id)
+            await pipe.execute()
+        AUDIT_EVENTS.labels("dead_lettered").inc()
+        logger.error("Audit entry %s moved to %s: %s", entry_id, AUDIT_DEAD_LETTER_STREAM, reason)
+
+    async def _claim(self):
+        # one at a time, so an entry the database rejects is retried on its
+        # own instead of failing the rest of a batch with it
+        _, claimed, *_ = await self.redis_client.xautoclaim(
+            audit_sinks.AUDIT_STREAM, AUDIT_CONSUMER_GROUP, AUDIT_CONSUMER_NAME,
+            min_idle_time=AUDIT_CLAIM_IDLE_MS, count=1)
+        entries = [entry for entry in claimed if entry[1]]
+        if not entries:
+            return []
+        entry_id, fields = entries[0]
+        pending = await self.redis_client.xpending_range(
+            audit_sinks.AUDIT_STREAM, AUDIT_CONSUMER_GROUP, min=entry_id, max=entry_id, count=1)
+        # the claim itself counts as a delivery
+        if pending and pending[0]["times_delivered"] > AUDIT_MAX_DELIVERIES:
+            await self._dead_letter(entry_id, fields, f"failed {AUDIT_MAX_DELIVERIES} times")
+            return []
+        return entries
+
+    async def read(self, count):
+        entries = await self._claim()
+        if not entries:
+            response = await self.redis_client.xreadgroup(
+                AUDIT_CONSUMER_GROUP, AUDIT_CONSUMER_NAME, {audit_sinks.AUDIT_STREAM: ">"},
+                count=count, block=int(AUDIT_POLL_SECONDS * 1000))
+            entries = response[0][1] if response else []
+        events, entry_ids = [], []
+        for entry_id, fields in entries:
+            try:
+                events.append(orjson.loads(fields["event"]))
+            except (KeyError, orjson.JSONDecodeError):
+                await self._dead_letter(entry_id, fields, "malformed")
+                continue
+            entry_ids.append(entry_id)
+        return events, entry_ids
+
+    async def ack(self, token):
+        if token:
+            await self.redis_client.xack(audit_sinks.AUDIT_STREAM, AUDIT_CONSUMER_GROUP, *token)
+
+    async def close(self):
+        await self.redis_client.aclose()
+
+
+class FileSource:
+    # the byte offset already imported is kept next to the file
+    def __init__(self, path=audit_sinks.AUDIT_FILE_PATH):
+        self.path = path
+        self.offset_path = f"{path}.offset"
+
+    async def start(self):
+        pass
+
+    def _read(self, count):
+        try:
+            with open(self.offset_path) as offset_file:
+                offset = int(offset_file.read() or 0)
+        except FileNotFoundError:
+            offset = 0
+        if not os.path.exists(self.path):
+            return [], offset
+        events = []
+        with open(self.path, "rb") as audit_file:
+            audit_file.seek(offset)
+            while len(events) < count:
+                line = audit_file.readline()
+                # a line without newline is still being written
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                events.append(orjson.loads(line))
+        return events, offset
+
+    async def read(self, count):
+        events, offset = await asyncio.to_thread(self._read, count)
+        if not events:
+            await asyncio.sleep(AUDIT_POLL_SECONDS)
+        return events, offset
+
+    async def ack(self, offset):
+        with open(self.offset_path, "w") as offset_file:
+            offset_file.write(str(offset))
+
+    async def close(self):
+        pass
+
+
+class KafkaSource:
+    def __init__(self):
+        try:
+            from aiokafka import AIOKafkaConsumer
+        except ImportError:
+            raise RuntimeError("--source kafka needs the aiokafka package")
+        self.consumer = AIOKafkaConsumer(
+            audit_sinks.AUDIT_KAFKA_TOPIC, bootstrap_servers=audit_sinks.KAFKA_BOOTSTRAP,
+            group_id=AUDIT_CONSUMER_GROUP, enable_auto_commit=False, auto_offset_reset="earliest")
+
+    async def start(self):
+        await self.consumer.start()
+
+    async def read(self, count):
+        batches = await self.consumer.getmany(timeout_ms=int(AUDIT_POLL_SECONDS * 1000), max_records=count)
+        return [orjson.loads(record.value) for records in batches.values() for record in records], None
+
+    async def ack(self, token):
+        await self.consumer.commit()
+
+    async def close(self):
+        await self.consumer.stop()
+
+
+def _row(event):
+    return {
+        "event_id": event["event_id"],
+        "event_type": event["event_type"],
+        "outcome": event["outcome"],
+        "user_id": event.get("user_id"),
+        "identifier": event.get("identifier"),
+        "request_id": event.get("request_id"),
+        "details": event.get("details"),
+        "occurred_at": datetime.fromisoformat(event["occurred_at"]),
+    }
+
+
+async def insert_events(db, events):
+    insert = database_setup.insert_by_dialect[db.bind.dialect.name]
+    statement = insert(AuditEvent).values([_row(event) for event in events]).on_conflict_do_nothing(
+        index_elements=["event_id"])
+    await db.execute(statement)
+    await db.commit()
+
+
+async def _build_source(name):
+    if name == "redis":
+        # a client of its own: XREADGROUP blocks longer than the API's socket timeout
+        return RedisStreamSource(redis.Redis(
+            host=redis_setup.REDIS_HOST, port=redis_setup.REDIS_PORT, db=redis_setup.REDIS_DB,
+            decode_responses=True, socket_connect_timeout=redis_setup.REDIS_CONNECT_TIMEOUT,
+            socket_timeout=AUDIT_POLL_SECONDS + redis_setup.REDIS_SOCKET_TIMEOUT))
+    if name == "file":
+        return FileSource()
+    if name == "kafka":
+        return KafkaSource()
+    raise ValueError(f"unknown audit source: {name}")
+
+
+async def store_batch(source, db, batch_size):
+    """Move one batch from the source into the database; False if it failed."""
+    try:
+        events, token = await source.read(batch_size)
+        if events:
+            await insert_events(db, events)
+        await source.ack(token)
+        if events:
+            logger.info("Stored %s audit events", len(events))
+        return True
+    except Exception as e:
+        # outages of the source or the database are waited out
+        await db.rollback()
+        logger.warning("Audit runner error, retrying: %s", e)
+        return False
+
+
+async def wait_for_database(db):
+    # nothing is read from the source while the database is down, so an
+    # outage doesn't count as deliveries towards AUDIT_MAX_DELIVERIES
+    while True:
+        try:
+            await db.execute(text("SELECT 1"))
+            await db.rollback()
+            return
+        except Exception as e:
+            await db.rollback()
+            logger.warning("Audit runner waiting for the database: %s", e)
+            await asyncio.sleep(AUDIT_POLL_SECONDS)
+
+
+async def run(source, batch_size):
+    await source.start()
+    async with database_setup.session_local() as db:
+        while True:
+            if not await store_batch(source, db, batch_size):
+                await asyncio.sleep(AUDIT_POLL_SECONDS)
+                await wait_for_database(db)
+
+
+async def _main(args):
+    source = await _build_source(args.source)
+    try:
+        await run(source, args.batch_size)
+    finally:
+        await source.close()
+        await database_setup.close_engine()
+
+
+def main():
+    logging_setup.configure_logging()
+    parser = argparse.ArgumentParser(description="Store audit events from the audit sink in Postgres.")
+    parser.add_argument("--source", choices=("redis", "file", "kafka"), default=audit_setup.AUDIT_SINK)
+    parser.add_argument("--batch-size", type=int, default=audit_setup.AUDIT_BATCH_SIZE)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
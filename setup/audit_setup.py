@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from setup.logging_setup import request_id_var
+from setup.metrics_setup import AUDIT_EVENTS
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# redis | file | kafka | none
+AUDIT_SINK = os.getenv("AUDIT_SINK", "redis")
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", 10000))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 0.5))
+AUDIT_MAX_ATTEMPTS = int(os.getenv("AUDIT_MAX_ATTEMPTS", 3))
+# how long shutdown may spend flushing the buffer; keep it well inside the
+# server's TIMEOUT_GRACEFUL_SHUTDOWN
+AUDIT_STOP_TIMEOUT = float(os.getenv("AUDIT_STOP_TIMEOUT", 10))
+
+# event types
+LOGIN = "login"
+OTP_ISSUED = "otp_issued"
+REGISTRATION = "registration"
+TOKEN_REFRESH = "token_refresh"
+LOGOUT = "logout"
+ADMIN_USER_ACCESS = "admin_user_access"
+
+SUCCESS = "success"
+FAILURE = "failure"
+
+
+class BaseAuditSink(ABC):
+    name = "base"
+
+    async def start(self):
+        pass
+
+    @abstractmethod
+    async def write(self, events: list[dict]) -> None:
+        pass
+
+    async def close(self):
+        pass
+
+
+class AuditPipeline:
+    """Buffers audit events in memory and hands them to a sink in batches.
+
+    emit() never waits: when the buffer is full the event is dropped and
+    counted, so auditing can't slow down or fail a request.
+    """
+
+    def __init__(self, sink, buffer_size=AUDIT_BUFFER_SIZE):
+        self.sink = sink
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        # taken off the queue but not written yet
+        self._batch = []
+        self._task = None
+
+    async def start(self):
+        await self.sink.start()
+        self._task = asyncio.create_task(self._flush_loop())
+        logger.info("Audit pipeline started with the %s sink", self.sink.name)
+
+    async def stop(self, timeout=AUDIT_STOP_TIMEOUT):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # a sink that is down would otherwise retry every batch past the
+        # shutdown window, and the worker gets killed halfway through
+        deadline = asyncio.get_running_loop().time() + timeout
+        try:
+            async with asyncio.timeout_at(deadline):
+                while self._batch or not self.queue.empty():
+                    if not self._batch:
+                        self._batch = [self.queue.get_nowait() for _ in range(min(AUDIT_BATCH_SIZE, self.queue.qsize()))]
+                    await self._write(self._batch)
+                    self._batch = []
+        except TimeoutError:
+            dropped = len(self._batch) + self.queue.qsize()
+            AUDIT_EVENTS.labels("dropped").inc(dropped)
+            logger.error("Audit pipeline stop timed out after %s s, dropped %s events", timeout, dropped)
+        try:
+            async with asyncio.timeout_at(max(deadline, asyncio.get_running_loop().time() + 1)):
+                await self.sink.close()
+        except TimeoutError:
+            logger.warning("Audit sink %s did not close in time", self.sink.name)
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def emit(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            AUDIT_EVENTS.labels("dropped").inc()
+
+    async def _next_batch(self):
+        # collected into self._batch, so stop() still writes what a
+        # cancelled collection had already taken off the queue
+        batch = self._batch
+        batch.append(await self.queue.get())
+        # asyncio.timeout rather than wait_for, which can swallow a
+        # cancellation that races with get() and leave stop() hanging
+        try:
+            async with asyncio.timeout(AUDIT_FLUSH_INTERVAL):
+                while len(batch) < AUDIT_BATCH_SIZE:
+                    batch.append(await self.queue.get())
+        except TimeoutError:
+            pass
+        return batch
+
+    async def _write(self, batch):
+        for attempt in range(1, AUDIT_MAX_ATTEMPTS + 1):
+            try:
+                await self.sink.write(batch)
+                AUDIT_EVENTS.labels("written").inc(len(batch))
+                return
+            except Exception as e:
+                logger.warning("Audit sink %s failed for %s events (attempt %s): %s",
+                               self.sink.name, len(batch), attempt, e)
+                if attempt < AUDIT_MAX_ATTEMPTS:
+                    await asyncio.sleep(AUDIT_FLUSH_INTERVAL * 2 ** (attempt - 1))
+        AUDIT_EVENTS.labels("failed").inc(len(batch))
+        logger.error("Dropped %s audit events after %s attempts", len(batch), AUDIT_MAX_ATTEMPTS)
+
+    async def _flush_loop(self):
+        while True:
+            await self._write(await self._next_batch())
+            self._batch = []
+
+
+_pipeline = None
+
+
+async def start_pipeline(sink):
+    global _pipeline
+    _pipeline = AuditPipeline(sink)
+    await _pipeline.start()
+    return _pipeline
+
+
+async def stop_pipeline():
+    global _pipeline
+    if _pipeline is not None:
+        await _pipeline.stop()
+        _pipeline = None
+
+
+def buffer_depth():
+    return _pipeline.depth() if _pipeline is not None else 0
+
+
+def emit(event_type, outcome, user_id=None, identifier=None, **details):
+    if _pipeline is None:
+        return
+    _pipeline.emit({
+        "event_id": uuid.uuid4().hex,
+        "event_type": event_type,
+        "outcome": outcome,
+        "user_id": user_id,
+        "identifier": identifier,
+        "request_id": request_id_var.get(),
+        "details": details or None,
+        "occurred_at": datetime.now(timezone.utc).isoformat(),
+    })
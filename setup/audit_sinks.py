@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import os
+
+import orjson
+from dotenv import load_dotenv
+
+from setup import redis_setup
+from setup.audit_setup import BaseAuditSink
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+AUDIT_STREAM = os.getenv("AUDIT_STREAM", "audit:events")
+# approximate cap, trimming is cheap with ~ and the runner keeps up
+AUDIT_STREAM_MAXLEN = int(os.getenv("AUDIT_STREAM_MAXLEN", 1000000))
+AUDIT_FILE_PATH = os.getenv("AUDIT_FILE_PATH", "audit.ndjson")
+AUDIT_KAFKA_TOPIC = os.getenv("AUDIT_KAFKA_TOPIC", "audit-events")
+KAFKA_BOOTSTRAP = os.getenv("KAFKA_BOOTSTRAP", "localhost:9092")
+
+
+class RedisStreamSink(BaseAuditSink):
+    name = "redis"
+
+    async def write(self, events):
+        redis_client = redis_setup.redis_info()
+        if not redis_client:
+            raise ConnectionError("Redis is not available")
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for event in events:
+                pipe.xadd(AUDIT_STREAM, {"event": orjson.dumps(event)}, maxlen=AUDIT_STREAM_MAXLEN, approximate=True)
+            await pipe.execute()
+
+
+class FileSink(BaseAuditSink):
+    name = "file"
+
+    def __init__(self, path=AUDIT_FILE_PATH):
+        self.path = path
+
+    def _append(self, lines):
+        with open(self.path, "ab") as audit_file:
+            audit_file.write(lines)
+
+    async def write(self, events):
+        lines = b"".join(orjson.dumps(event) + b"\n" for event in events)
+        await asyncio.to_thread(self._append, lines)
+
+
+class KafkaSink(BaseAuditSink):
+    name = "kafka"
+
+    def __init__(self, bootstrap_servers=KAFKA_BOOTSTRAP, topic=AUDIT_KAFKA_TOPIC):
+        try:
+            from aiokafka import AIOKafkaProducer
+        except ImportError:
+            raise RuntimeError("AUDIT_SINK=kafka needs the aiokafka package")
+        self.topic = topic
+        self.producer = AIOKafkaProducer(bootstrap_servers=bootstrap_servers, linger_ms=10)
+
+    async def start(self):
+        await self.producer.start()
+
+    async def write(self, events):
+        sends = [await self.producer.send(self.topic, orjson.dumps(event)) for event in events]
+        await asyncio.gather(*sends)
+
+    async def close(self):
+        await self.producer.stop()
+
+
+SINKS = {
+    "redis": RedisStreamSink,
+    "file": FileSink,
+    "kafka": KafkaSink,
+}
+
+
+def build_sink(name):
+    if name not in SINKS:
+        raise ValueError(f"unknown audit sink: {name}")
+    return SINKS[name]()
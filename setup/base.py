@@ -1,6 +1,85 @@
+import logging
+from contextlib import asynccontextmanager
 import fastapi
-from app import register,auth
-app = fastapi.FastAPI()
 
-app.include_router(register.router, prefix="/api")
-app.include_router(auth.router, prefix="/api")
+logger = logging.getLogger(__name__)
+
+# the app and setup modules are imported by create_app and the lifespan,
+# not here: they pull in SQLAlchemy, redis, argon2 and the models, and
+# importing this module alone (the launcher, tooling) shouldn't pay for it
+
+
+@asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    from app import availability, revocation, tokens
+    from providers.mock_provider import MockMessageProvider
+    from setup import audit_setup, database_setup, hashing_setup, health_setup, message_dispatcher, metrics_setup, redis_setup
+
+    health_setup.set_state(health_setup.STARTING)
+    hashing_setup.get_executor()
+    tokens.load_keys()
+    await redis_setup.init_redis()
+    await database_setup.start_replica_checks()
+    message_dispatcher.start_dispatcher(MockMessageProvider())
+    availability.start()
+    revocation.start()
+    if audit_setup.AUDIT_SINK != "none":
+        from setup import audit_sinks
+        await audit_setup.start_pipeline(audit_sinks.build_sink(audit_setup.AUDIT_SINK))
+    await health_setup.warm_up()
+    metrics_setup.start_gauge_refresh()
+    health_setup.set_state(health_setup.READY)
+    yield
+    # fail readiness first, so the load balancer stops routing here
+    health_setup.set_state(health_setup.STOPPING)
+    metrics_setup.stop_gauge_refresh()
+    await audit_setup.stop_pipeline()
+    await revocation.stop()
+    await availability.stop()
+    await message_dispatcher.stop_dispatcher()
+    await redis_setup.close_redis()
+    hashing_setup.shutdown_executor()
+    await database_setup.close_engine()
+
+
+def create_app():
+    """Build the application; used by the launcher as an app factory."""
+    from starlette.exceptions import HTTPException as StarletteHTTPException
+    from app import admin_users, auth, register, tokens
+    from setup import health_setup, logging_setup, metrics_setup, profiling_setup, response_setup
+
+    logging_setup.configure_logging()
+    app = fastapi.FastAPI(lifespan=lifespan, default_response_class=response_setup.ORJSONResponse)
+    app.add_exception_handler(StarletteHTTPException, response_setup.http_exception_handler)
+    app.add_middleware(metrics_setup.MetricsMiddleware)
+    if profiling_setup.PROFILING_ENABLED:
+        # inside RequestIdMiddleware, so stored profiles carry the request id
+        app.add_middleware(profiling_setup.ProfilingMiddleware)
+    app.add_middleware(logging_setup.RequestIdMiddleware)
+
+    app.include_router(register.router)
+    app.include_router(auth.router)
+    if metrics_setup.METRICS_ENABLED:
+        app.include_router(metrics_setup.router)
+    else:
+        logger.warning("METRICS_TOKEN is not set, /metrics is not served")
+    app.include_router(health_setup.router)
+    app.include_router(tokens.router)
+    if profiling_setup.PROFILING_ENABLED:
+        app.include_router(profiling_setup.router)
+    if admin_users.ADMIN_ENABLED:
+        app.include_router(admin_users.router)
+    return app
+
+
+_app = None
+
+
+def __getattr__(name):
+    # keeps `uvicorn setup.base:app` working without building an app on import
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,96 @@
+import logging
+import math
+import os
+import time
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", 10))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", 1))
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+breakers = {}
+
+
+class CircuitBreaker:
+    """Stops calling a dependency after repeated connectivity failures.
+
+    After failure_threshold consecutive failures the breaker opens and
+    callers fail fast. Once reset_seconds have passed, up to
+    half_open_calls probes are let through; a success closes it again,
+    a failure reopens it.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds=BREAKER_RESET_SECONDS, half_open_calls=BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        breakers[name] = self
+
+    def is_open(self):
+        # no side effects, for callers that only want to skip optional work
+        return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_seconds
+
+    def allow_request(self):
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < self.reset_seconds:
+            return self.state == HALF_OPEN and self._take_probe()
+        if self.state == OPEN:
+            logger.info("Circuit %s is half open, probing", self.name)
+            self.state = HALF_OPEN
+        # probes that never report back must not keep the breaker stuck
+        self.opened_at = now
+        self._probes = 0
+        return self._take_probe()
+
+    def _take_probe(self):
+        if self._probes >= self.half_open_calls:
+            return False
+        self._probes += 1
+        return True
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info("Circuit %s closed", self.name)
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning("Circuit %s opened after %s failures", self.name, self.failures)
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def retry_after(self):
+        if self.state == CLOSED:
+            return 1
+        return max(1, math.ceil(self.reset_seconds - (time.monotonic() - self.opened_at)))
+
+    def unavailable(self):
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                             detail={"message":"Service temporarily unavailable, please try again later."},
+                             headers={"Retry-After": str(self.retry_after())})
+
+
+def status_report():
+    return {name: {"state": breaker.state, "failures": breaker.failures} for name, breaker in breakers.items()}
@@ -1,8 +1,20 @@
+import asyncio
+import itertools
+import logging
 import os
+import time
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import event, make_url, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base
+
+from setup.circuit_breaker import CircuitBreaker
+from setup.metrics_setup import STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
@@ -13,18 +25,231 @@ postgres_host = os.getenv("POSTGRES_HOST")
 postgres_db = os.getenv("POSTGRES_DB")
 postgres_port = os.getenv("POSTGRES_PORT")
 
-db_url = f"postgresql://{postgres_user}:{postgres_password}@{postgres_host}:{postgres_port}/{postgres_db}"
-engine = create_engine(
-    db_url,
-    echo=False,
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# asyncpg only: seconds to establish a connection and to run one statement
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", 2))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", 5))
+# connections per engine opened at startup, before the worker reports ready
+DB_WARM_CONNECTIONS = int(os.getenv("DB_WARM_CONNECTIONS", DB_POOL_SIZE))
+
+# comma separated, same URL format as DATABASE_URL
+DB_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# identifiers written within this window are read from the primary, and a
+# replica lagging further behind than this is taken out of rotation
+DB_REPLICA_LAG_SECONDS = float(os.getenv("DB_REPLICA_LAG_SECONDS", 5))
+DB_REPLICA_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_HEALTH_CHECK_INTERVAL", 5))
+DB_REPLICA_TIMEOUT = float(os.getenv("DB_REPLICA_TIMEOUT", 2))
+
+# 0 when the replica has replayed everything it received, NULL on a primary
+PG_REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
 )
-session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+db_url = os.getenv(
+    "DATABASE_URL",
+    f"postgresql+asyncpg://{postgres_user}:{postgres_password}@{postgres_host}:{postgres_port}/{postgres_db}",
+)
+_db_execute_latency = STAGE_LATENCY.labels("db_execute")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # on the statement's execution context, so a failed statement leaves
+    # nothing behind on the connection
+    if context is not None:
+        context.query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "query_started", None)
+    if started is not None:
+        _db_execute_latency.observe(time.perf_counter() - started)
+
+
+def _connect_args(url):
+    if make_url(url).get_driver_name() == "asyncpg":
+        return {"timeout": DB_CONNECT_TIMEOUT, "command_timeout": DB_COMMAND_TIMEOUT}
+    return {}
+
+
+def _create_engine(url):
+    created = create_async_engine(
+        url,
+        echo=False,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=_connect_args(url),
+    )
+    event.listen(created.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(created.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    return created
+
+
+engine = _create_engine(db_url)
+# INSERT ... ON CONFLICT for bulk writes
+insert_by_dialect = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+db_breaker = CircuitBreaker("postgres")
+
+
+class PrimarySession(Session):
+    pass
+
+
+def _primary_error(context):
+    # pre-ping failures are stale pooled connections, the pool reconnects
+    if context.is_pre_ping:
+        return
+    if context.is_disconnect or context.connection is None or isinstance(context.original_exception, (OSError, TimeoutError)):
+        db_breaker.record_failure()
+    else:
+        # e.g. an IntegrityError, the database answered
+        db_breaker.record_success()
+
+
+def _primary_success(conn, cursor, statement, parameters, context, executemany):
+    db_breaker.record_success()
+
+
+def _check_breaker(*args):
+    # runs before the session checks out a connection, so an open
+    # breaker never waits on a connect timeout
+    if not db_breaker.allow_request():
+        raise db_breaker.unavailable()
+
+
+event.listen(engine.sync_engine, "handle_error", _primary_error)
+event.listen(engine.sync_engine, "after_cursor_execute", _primary_success)
+event.listen(PrimarySession, "do_orm_execute", _check_breaker)
+event.listen(PrimarySession, "before_flush", _check_breaker)
+
+session_local = async_sessionmaker(bind=engine, class_=AsyncSession, sync_session_class=PrimarySession,
+                                   autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
-def get_db():
-    db = session_local()
-    try:
+class Replica:
+    def __init__(self, url):
+        self.engine = _create_engine(url)
+        self.session_local = async_sessionmaker(bind=self.engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+        self.name = self.engine.url.render_as_string(hide_password=True)
+        self.healthy = True
+
+    async def check_health(self):
+        try:
+            async with asyncio.timeout(DB_REPLICA_TIMEOUT):
+                async with self.engine.connect() as connection:
+                    if self.engine.dialect.name == "postgresql":
+                        lag = float(await connection.scalar(PG_REPLICA_LAG_QUERY) or 0)
+                    else:
+                        await connection.execute(text("SELECT 1"))
+                        lag = 0.0
+            healthy = lag <= DB_REPLICA_LAG_SECONDS
+            if not healthy:
+                logger.warning("Replica %s is %.1f s behind, reading from the primary", self.name, lag)
+        except (DBAPIError, OSError, TimeoutError) as e:
+            logger.warning("Replica %s health check failed: %s", self.name, e)
+            healthy = False
+        if healthy and not self.healthy:
+            logger.info("Replica %s is back in rotation", self.name)
+        self.healthy = healthy
+        return healthy
+
+    def mark_down(self, error):
+        if self.healthy:
+            logger.warning("Replica %s failed, reading from the primary until it recovers: %s", self.name, error)
+        self.healthy = False
+
+
+replicas = [Replica(url) for url in DB_REPLICA_URLS]
+_replica_cycle = itertools.count()
+_replica_health_task = None
+
+
+def pick_replica():
+    # round robin over the replicas that passed their last health check
+    for _ in range(len(replicas)):
+        replica = replicas[next(_replica_cycle) % len(replicas)]
+        if replica.healthy:
+            return replica
+    return None
+
+
+async def read_rows(db, statement):
+    """Run a read-only statement on a healthy replica, or on the primary session db when none is."""
+    replica = pick_replica()
+    if replica is not None:
+        try:
+            async with replica.session_local() as session:
+                return (await session.execute(statement)).all()
+        except (DBAPIError, OSError) as e:
+            replica.mark_down(e)
+    return (await db.execute(statement)).all()
+
+
+async def _replica_health_loop():
+    while True:
+        await asyncio.sleep(DB_REPLICA_HEALTH_CHECK_INTERVAL)
+        await asyncio.gather(*(replica.check_health() for replica in replicas))
+
+
+async def start_replica_checks():
+    global _replica_health_task
+    if not replicas:
+        return
+    await asyncio.gather(*(replica.check_health() for replica in replicas))
+    _replica_health_task = asyncio.create_task(_replica_health_loop())
+
+
+async def _open_connections(target, count):
+    async def connect():
+        async with target.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    # held concurrently, so each one is a separate pooled connection
+    await asyncio.gather(*(connect() for _ in range(count)))
+
+
+async def warm_up():
+    await asyncio.gather(_open_connections(engine, min(DB_WARM_CONNECTIONS, DB_POOL_SIZE)),
+                         *(_open_connections(replica.engine, min(DB_WARM_CONNECTIONS, DB_POOL_SIZE))
+                           for replica in replicas if replica.healthy))
+
+
+async def get_db():
+    async with session_local() as db:
         yield db
-    finally:
-        db.close()
+
+
+def pool_status():
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+    }
+
+
+def replica_status():
+    return {replica.name: replica.healthy for replica in replicas}
+
+
+async def close_engine():
+    global _replica_health_task
+    if _replica_health_task is not None:
+        _replica_health_task.cancel()
+        _replica_health_task = None
+    for replica in replicas:
+        await replica.engine.dispose()
+    await engine.dispose()
@@ -0,0 +1,97 @@
+import argparse
+import logging
+import os
+import statistics
+import time
+
+from dotenv import load_dotenv
+from passlib.context import CryptContext
+
+from setup.logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# values printed by `python -m setup.hashing_policy calibrate`
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 1))
+
+
+def build_context(time_cost, memory_cost, parallelism):
+    # min_rounds makes needs_update() flag hashes weaker than the policy,
+    # the argon2 handler already flags a different memory_cost
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__rounds=time_cost,
+        argon2__min_rounds=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=parallelism,
+    )
+
+
+pwd_context = build_context(ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM)
+
+
+def measure_verify(time_cost, memory_cost, parallelism, samples):
+    context = build_context(time_cost, memory_cost, parallelism)
+    hashed_password = context.hash("calibration-password")
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.verify("calibration-password", hashed_password)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.quantiles(timings, n=100)[98]
+
+
+def calibrate(target_ms, max_memory_cost, min_memory_cost, parallelism, samples, max_time_cost=10):
+    """Pick the strongest parameters whose p99 verify latency stays under target_ms.
+
+    Memory is preferred over iterations: start at max_memory_cost and raise
+    time_cost while it fits, halving memory only if time_cost=1 is too slow.
+    """
+    memory_cost = max_memory_cost
+    while True:
+        p99 = measure_verify(1, memory_cost, parallelism, samples)
+        logger.info("time_cost=1 memory_cost=%s parallelism=%s: p99 %.1f ms", memory_cost, parallelism, p99)
+        if p99 <= target_ms or memory_cost // 2 < min_memory_cost:
+            break
+        memory_cost //= 2
+
+    time_cost = 1
+    while time_cost < max_time_cost:
+        candidate_p99 = measure_verify(time_cost + 1, memory_cost, parallelism, samples)
+        logger.info("time_cost=%s memory_cost=%s parallelism=%s: p99 %.1f ms", time_cost + 1, memory_cost, parallelism, candidate_p99)
+        if candidate_p99 > target_ms:
+            break
+        time_cost += 1
+        p99 = candidate_p99
+    return {"time_cost": time_cost, "memory_cost": memory_cost, "parallelism": parallelism, "p99_ms": p99}
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Argon2 hashing policy tools.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = subcommands.add_parser("calibrate", help="benchmark this host and suggest ARGON2_* settings")
+    calibrate_parser.add_argument("--target-ms", type=float, default=50, help="p99 verify latency budget")
+    calibrate_parser.add_argument("--max-memory-kib", type=int, default=65536)
+    calibrate_parser.add_argument("--min-memory-kib", type=int, default=19456)
+    # the hashing pool already spreads requests over the cores
+    calibrate_parser.add_argument("--parallelism", type=int, default=1)
+    calibrate_parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+
+    result = calibrate(args.target_ms, args.max_memory_kib, args.min_memory_kib, args.parallelism, args.samples)
+    if result["p99_ms"] > args.target_ms:
+        logger.warning("Could not reach %s ms p99 above %s KiB, using the cheapest setting", args.target_ms, args.min_memory_kib)
+    print(f"ARGON2_TIME_COST={result['time_cost']}")
+    print(f"ARGON2_MEMORY_COST={result['memory_cost']}")
+    print(f"ARGON2_PARALLELISM={result['parallelism']}")
+    print(f"# measured p99 verify latency: {result['p99_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+from setup.hashing_policy import pwd_context
+from setup.metrics_setup import timed_stage
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+HASHING_POOL_SIZE = int(os.getenv("HASHING_POOL_SIZE", os.cpu_count() or 1))
+# extra jobs allowed to wait for a free worker before new ones are rejected
+HASHING_QUEUE_DEPTH = int(os.getenv("HASHING_QUEUE_DEPTH", HASHING_POOL_SIZE * 4))
+# workers bulk hashing may occupy at once; the rest stay free for logins
+HASHING_BULK_CONCURRENCY = max(1, int(os.getenv("HASHING_BULK_CONCURRENCY", HASHING_POOL_SIZE // 2)))
+
+_executor = None
+_pending = 0
+_bulk_slots = asyncio.Semaphore(HASHING_BULK_CONCURRENCY)
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify(password, hashed_password):
+    return pwd_context.verify(password, hashed_password)
+
+
+def _verify_and_update(password, hashed_password):
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+def _load_backend():
+    # the argon2 backend is loaded on first use, in each worker process
+    pwd_context.handler().get_backend()
+    return os.getpid()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASHING_POOL_SIZE)
+        logger.info("Hashing pool started with %s workers, queue depth %s", HASHING_POOL_SIZE, HASHING_QUEUE_DEPTH)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        logger.info("Hashing pool stopped")
+
+
+async def warm_up():
+    """Start every pool process and load the hashing backend in it."""
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    await asyncio.gather(*(loop.run_in_executor(executor, _load_backend) for _ in range(HASHING_POOL_SIZE)))
+
+
+def queue_depth():
+    return _pending
+
+
+async def _submit(func, *args):
+    global _pending
+    if _pending >= HASHING_POOL_SIZE + HASHING_QUEUE_DEPTH:
+        logger.warning("Hashing queue is full (%s pending), rejecting request", _pending)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail={"message":"Service is busy, please try again later."},
+                            headers={"Retry-After": "1"})
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), func, *args)
+    finally:
+        _pending -= 1
+
+
+@timed_stage("password_hash")
+async def hash_password(password):
+    return await _submit(_hash, password)
+
+
+@timed_stage("password_verify")
+async def verify_password(password, hashed_password):
+    return await _submit(_verify, password, hashed_password)
+
+
+@timed_stage("password_verify")
+async def verify_and_update(password, hashed_password):
+    # returns (valid, new_hash); new_hash is set when the stored hash
+    # was made with parameters older than the current policy
+    return await _submit(_verify_and_update, password, hashed_password)
+
+
+@timed_stage("password_hash_bulk")
+async def hash_bulk(password):
+    # one job per password, so a login queues behind at most one bulk hash
+    # per busy worker, and every bulk job counts towards the backpressure
+    async with _bulk_slots:
+        return await _submit(_hash, password)
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import time
+
+from fastapi import APIRouter, status
+
+from setup import database_setup, hashing_setup, redis_setup
+from setup.response_setup import ORJSONResponse
+
+logger = logging.getLogger(__name__)
+
+STARTING = "starting"
+READY = "ready"
+STOPPING = "stopping"
+
+router = APIRouter(prefix="/health", include_in_schema=False)
+state = STARTING
+startup_timings = {}
+
+
+async def _timed(name, warm_up):
+    started = time.perf_counter()
+    try:
+        await warm_up()
+    except Exception as e:
+        # not fatal, the breakers take over if the dependency stays down
+        logger.warning("Warming up %s failed: %s", name, e)
+    startup_timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def warm_up():
+    """Fill the DB and Redis pools and start the hashing pool, concurrently."""
+    started = time.perf_counter()
+    await asyncio.gather(
+        _timed("database", database_setup.warm_up),
+        _timed("redis", redis_setup.warm_up),
+        _timed("hashing", hashing_setup.warm_up),
+    )
+    startup_timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Worker warmed up", extra={"startup_ms": startup_timings})
+
+
+def set_state(new_state):
+    global state
+    state = new_state
+
+
+@router.get("/live")
+async def live():
+    # answering at all means the event loop isn't stuck
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def ready():
+    # only this worker's own state; a shared dependency being down would
+    # otherwise take every worker out of rotation at once
+    body = {
+        "status": state,
+        "startup_ms": startup_timings,
+        "redis": redis_setup.redis_healthy,
+        "database": database_setup.db_breaker.state,
+    }
+    if state != READY:
+        return ORJSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=body)
+    return body
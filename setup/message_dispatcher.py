@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import random
+import uuid
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+from app.local_cache import LocalCache, MISSING
+from setup.metrics_setup import MESSAGE_DELIVERIES
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+MESSAGE_QUEUE_SIZE = int(os.getenv("MESSAGE_QUEUE_SIZE", 10000))
+MESSAGE_BATCH_WAIT = float(os.getenv("MESSAGE_BATCH_WAIT", 0.05))
+MESSAGE_MAX_ATTEMPTS = int(os.getenv("MESSAGE_MAX_ATTEMPTS", 4))
+MESSAGE_RETRY_BASE_DELAY = float(os.getenv("MESSAGE_RETRY_BASE_DELAY", 0.5))
+MESSAGE_STATUS_TTL = int(os.getenv("MESSAGE_STATUS_TTL", 600))
+MESSAGE_STATUS_SIZE = int(os.getenv("MESSAGE_STATUS_SIZE", 100000))
+
+QUEUED = "queued"
+SENT = "sent"
+RETRYING = "retrying"
+FAILED = "failed"
+
+
+class DispatcherFull(Exception):
+    pass
+
+
+@dataclass
+class OutgoingMessage:
+    id: str
+    to: str
+    message: str
+    attempts: int = 0
+
+
+class MessageDispatcher:
+    """Sends messages through a provider from background workers.
+
+    One worker per provider.max_concurrency slot; providers that support
+    bulk sends get up to max_batch_size messages per call, collected for
+    at most MESSAGE_BATCH_WAIT seconds. Failed sends are retried with
+    jittered exponential backoff up to MESSAGE_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, provider, queue_size=MESSAGE_QUEUE_SIZE):
+        self.provider = provider
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.statuses = LocalCache(MESSAGE_STATUS_SIZE)
+        self._workers = []
+        # pending backoff timers and the message each one requeues
+        self._retries = {}
+        self._stopping = False
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.provider.max_concurrency)]
+        logger.info("Message dispatcher started for %s with %s workers", self.provider.name, len(self._workers))
+
+    async def stop(self, timeout=5):
+        self._stopping = True
+        # messages waiting out a backoff get their last attempt now rather
+        # than being dropped with their timer
+        if self._retries:
+            logger.info("Message dispatcher flushing %s pending retries", len(self._retries))
+        for handle, outgoing in list(self._retries.items()):
+            handle.cancel()
+            self._requeue(outgoing)
+        self._retries.clear()
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            undelivered = 0
+            while not self.queue.empty():
+                self._fail(self.queue.get_nowait())
+                self.queue.task_done()
+                undelivered += 1
+            logger.warning("Message dispatcher stopped with %s messages undelivered", undelivered)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def is_full(self):
+        return self.queue.full()
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def status(self, message_id):
+        status = self.statuses.get(message_id)
+        return None if status is MISSING else status
+
+    def enqueue(self, to, message):
+        outgoing = OutgoingMessage(id=uuid.uuid4().hex, to=to, message=message)
+        try:
+            self.queue.put_nowait(outgoing)
+        except asyncio.QueueFull:
+            raise DispatcherFull()
+        self._set_status(outgoing, QUEUED)
+        return outgoing.id
+
+    def _set_status(self, outgoing, status):
+        self.statuses.set(outgoing.id, status, MESSAGE_STATUS_TTL)
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        if not self.provider.supports_batch:
+            return batch
+        # asyncio.timeout rather than wait_for, which can swallow a
+        # cancellation that races with get() and leave stop() hanging
+        try:
+            async with asyncio.timeout(MESSAGE_BATCH_WAIT):
+                while len(batch) < self.provider.max_batch_size:
+                    batch.append(await self.queue.get())
+        except TimeoutError:
+            pass
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                if len(batch) == 1:
+                    results = [await self.provider.send_message(to=batch[0].to, message=batch[0].message)]
+                else:
+                    results = await self.provider.send_batch([{"to": item.to, "message": item.message} for item in batch])
+            except Exception as e:
+                logger.warning("Message provider %s failed for %s messages: %s", self.provider.name, len(batch), e)
+                results = [None] * len(batch)
+            if len(results) != len(batch):
+                # every message needs an outcome and a task_done(), or stop() waits on it
+                logger.warning("Message provider %s returned %s results for %s messages, retrying the rest",
+                               self.provider.name, len(results), len(batch))
+                results = list(results[:len(batch)]) + [None] * (len(batch) - len(results))
+            for outgoing, result in zip(batch, results):
+                if result and result.get("status") == "success":
+                    self._set_status(outgoing, SENT)
+                    MESSAGE_DELIVERIES.labels(self.provider.name, SENT).inc()
+                else:
+                    self._retry(outgoing)
+                self.queue.task_done()
+
+    def _fail(self, outgoing):
+        self._set_status(outgoing, FAILED)
+        MESSAGE_DELIVERIES.labels(self.provider.name, FAILED).inc()
+        logger.error("Message %s to %s failed after %s attempts", outgoing.id, outgoing.to, outgoing.attempts)
+
+    def _requeue(self, outgoing):
+        try:
+            self.queue.put_nowait(outgoing)
+        except asyncio.QueueFull:
+            self._fail(outgoing)
+
+    def _retry(self, outgoing):
+        outgoing.attempts += 1
+        if outgoing.attempts >= MESSAGE_MAX_ATTEMPTS or self._stopping:
+            self._fail(outgoing)
+            return
+        self._set_status(outgoing, RETRYING)
+        MESSAGE_DELIVERIES.labels(self.provider.name, RETRYING).inc()
+        delay = MESSAGE_RETRY_BASE_DELAY * 2 ** (outgoing.attempts - 1) * random.uniform(0.5, 1.5)
+
+        def requeue():
+            self._retries.pop(handle, None)
+            self._requeue(outgoing)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries[handle] = outgoing
+
+
+_dispatcher = None
+
+
+def start_dispatcher(provider):
+    global _dispatcher
+    _dispatcher = MessageDispatcher(provider)
+    _dispatcher.start()
+    return _dispatcher
+
+
+async def stop_dispatcher():
+    global _dispatcher
+    if _dispatcher is not None:
+        await _dispatcher.stop()
+        _dispatcher = None
+
+
+def get_dispatcher():
+    return _dispatcher
+
+
+def queue_depth():
+    return _dispatcher.queue_depth() if _dispatcher is not None else 0
@@ -1,6 +1,23 @@
 from abc import ABC, abstractmethod
 
 class BaseMessageProvider(ABC):
+    name = "base"
+    # concurrent send calls the dispatcher may have open against this provider
+    max_concurrency = 10
+    # providers with a bulk API set this and override send_batch
+    supports_batch = False
+    max_batch_size = 1
+
     @abstractmethod
     async def send_message(self, to: str, message: str) -> dict:
-        pass
\ No newline at end of file
+        pass
+
+    async def send_batch(self, messages: list[dict]) -> list[dict]:
+        # one result per message, a failure only affects its own entry
+        results = []
+        for item in messages:
+            try:
+                results.append(await self.send_message(to=item["to"], message=item["message"]))
+            except Exception as e:
+                results.append({"status": "error", "to": item["to"], "description": str(e)})
+        return results
@@ -0,0 +1,240 @@
+import asyncio
+import functools
+import hmac
+import inspect
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# seconds between gauge updates; with several workers a scrape only runs
+# in one of them, so the others publish their gauges on this interval
+METRICS_GAUGE_INTERVAL = float(os.getenv("METRICS_GAUGE_INTERVAL", 5))
+# bearer tokens the scraper sends, comma separated for rotation; kept
+# apart from the admin tokens, and /metrics isn't mounted when none is set
+METRICS_TOKENS = [token.strip() for token in os.getenv("METRICS_TOKEN", "").split(",") if token.strip()]
+METRICS_ENABLED = bool(METRICS_TOKENS)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_LATENCY = Histogram(
+    "vienna_pulse_request_duration_seconds",
+    "Request latency per endpoint",
+    ["method", "endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_OUTCOMES = Counter(
+    "vienna_pulse_request_outcomes_total",
+    "Requests per endpoint by outcome",
+    ["endpoint", "outcome"],
+)
+STAGE_LATENCY = Histogram(
+    "vienna_pulse_stage_duration_seconds",
+    "Latency of the stages a request goes through",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+MESSAGE_DELIVERIES = Counter(
+    "vienna_pulse_message_deliveries_total",
+    "Outgoing message delivery attempts by result",
+    ["provider", "status"],
+)
+AUDIT_EVENTS = Counter(
+    "vienna_pulse_audit_events_total",
+    "Audit events by what happened to them: written, dropped, failed or dead_lettered",
+    ["result"],
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "vienna_pulse_single_flight_calls_total",
+    "Coalesced operations by role: leader ran it, shared or remote reused a result",
+    ["operation", "role"],
+)
+# with PROMETHEUS_MULTIPROC_DIR set, the workers' values are combined at
+# scrape time: pool and queue gauges summed, health the worst of them
+DB_POOL_CONFIGURED = Gauge("vienna_pulse_db_pool_size", "Configured DB pool size", multiprocess_mode="livesum")
+DB_POOL_CHECKED_OUT = Gauge("vienna_pulse_db_pool_checked_out", "DB connections in use", multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge("vienna_pulse_db_pool_overflow", "DB connections opened beyond the pool size",
+                         multiprocess_mode="livesum")
+DB_REPLICAS_HEALTHY = Gauge("vienna_pulse_db_replicas_healthy", "DB read replicas currently in rotation",
+                            multiprocess_mode="livemin")
+REDIS_POOL_IN_USE = Gauge("vienna_pulse_redis_pool_in_use", "Redis connections in use", multiprocess_mode="livesum")
+REDIS_POOL_AVAILABLE = Gauge("vienna_pulse_redis_pool_available", "Idle Redis connections", multiprocess_mode="livesum")
+REDIS_HEALTHY = Gauge("vienna_pulse_redis_healthy", "1 if the last Redis health check passed", multiprocess_mode="livemin")
+CIRCUIT_STATE = Gauge("vienna_pulse_circuit_state", "Circuit breaker state: 0 closed, 1 half open, 2 open", ["name"],
+                      multiprocess_mode="livemax")
+HASHING_QUEUE = Gauge("vienna_pulse_hashing_queue_depth", "Hashing jobs running or waiting",
+                            multiprocess_mode="livesum")
+MESSAGE_QUEUE = Gauge("vienna_pulse_message_queue_depth", "Messages waiting for delivery",
+                            multiprocess_mode="livesum")
+AUDIT_BUFFER = Gauge("vienna_pulse_audit_buffer_depth", "Audit events waiting to be written to the sink",
+                           multiprocess_mode="livesum")
+
+router = APIRouter()
+_gauge_task = None
+
+_OUTCOMES = {
+    400: "invalid_request",
+    401: "unauthorized",
+    429: "rate_limited",
+    503: "unavailable",
+}
+
+
+def _outcome(status_code):
+    if status_code < 400:
+        return "success"
+    if status_code in _OUTCOMES:
+        return _OUTCOMES[status_code]
+    return "client_error" if status_code < 500 else "server_error"
+
+
+def _endpoint_label(scope):
+    # the route template, not the raw path, keeps label cardinality bounded
+    # routers carry their own prefix and are included without one, so the
+    # template is the full path
+    route = scope.get("route")
+    return route.path_format if route is not None else "unmatched"
+
+
+def timed_stage(name):
+    """Decorator recording the wrapped function's duration as a stage."""
+    # labels are resolved once here, not on every call
+    histogram = STAGE_LATENCY.labels(name)
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware, avoids the per-request task of BaseHTTPMiddleware."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            endpoint = _endpoint_label(scope)
+            REQUEST_LATENCY.labels(scope["method"], endpoint, str(status_code)).observe(time.perf_counter() - started)
+            REQUEST_OUTCOMES.labels(endpoint, _outcome(status_code)).inc()
+
+
+def refresh_gauges():
+    # plain reads of in-process state, cheap enough for every scrape
+    from setup import audit_setup, circuit_breaker, database_setup, hashing_setup, message_dispatcher, redis_setup
+
+    def redis_pool_size(attribute):
+        pool = redis_setup.redis_pool
+        return len(getattr(pool, attribute, ())) if pool is not None else 0
+
+    pool = database_setup.engine.pool
+    DB_POOL_CONFIGURED.set(pool.size())
+    DB_POOL_CHECKED_OUT.set(pool.checkedout())
+    DB_POOL_OVERFLOW.set(max(0, pool.overflow()))
+    DB_REPLICAS_HEALTHY.set(sum(replica.healthy for replica in database_setup.replicas))
+    REDIS_POOL_IN_USE.set(redis_pool_size("_in_use_connections"))
+    REDIS_POOL_AVAILABLE.set(redis_pool_size("_available_connections"))
+    REDIS_HEALTHY.set(1 if redis_setup.redis_healthy else 0)
+    for name, breaker in circuit_breaker.breakers.items():
+        CIRCUIT_STATE.labels(name).set(circuit_breaker.STATE_VALUES[breaker.state])
+    HASHING_QUEUE.set(hashing_setup.queue_depth())
+    MESSAGE_QUEUE.set(message_dispatcher.queue_depth())
+    AUDIT_BUFFER.set(audit_setup.buffer_depth())
+
+
+async def _gauge_loop():
+    while True:
+        try:
+            refresh_gauges()
+        except Exception as e:
+            logger.warning("Updating gauges failed: %s", e)
+        await asyncio.sleep(METRICS_GAUGE_INTERVAL)
+
+
+def start_gauge_refresh():
+    global _gauge_task
+    if _gauge_task is None:
+        _gauge_task = asyncio.create_task(_gauge_loop())
+
+
+def stop_gauge_refresh():
+    global _gauge_task
+    if _gauge_task is not None:
+        _gauge_task.cancel()
+        _gauge_task = None
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # drops this worker's live gauges from the combined values
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def _registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def require_metrics_token(authorization: str | None = Header(None)):
+    token = authorization[7:].strip() if authorization and authorization.lower().startswith("bearer ") else None
+    # compared against every token, so timing doesn't tell which one is close
+    matches = [hmac.compare_digest(token.encode(), expected.encode()) for expected in METRICS_TOKENS] if token else []
+    if not any(matches):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail={"message":"Invalid or missing metrics token"},
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+@router.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def metrics():
+    refresh_gauges()
+    return Response(content=generate_latest(_registry()), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import collections
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from starlette.responses import Response
+
+from setup import redis_setup
+from setup.logging_setup import request_id_var
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# when false the middleware and the admin routes aren't installed at all
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# signs X-Profile tokens; without it only sampled requests are profiled
+PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL", 0.005))
+PROFILING_MAX_CONCURRENT = int(os.getenv("PROFILING_MAX_CONCURRENT", 2))
+PROFILING_MAX_STORED = int(os.getenv("PROFILING_MAX_STORED", 100))
+PROFILING_RETENTION_SECONDS = int(os.getenv("PROFILING_RETENTION_SECONDS", 86400))
+
+PROFILE_HEADER = b"x-profile"
+PROFILES_KEY = "profiles"
+ADMIN_PREFIX = "/admin/"
+
+router = APIRouter(prefix="/admin/profiles", include_in_schema=False)
+_active = 0
+_labels = {}
+
+
+def sign(expires):
+    signature = hmac.new(PROFILING_SECRET.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def verify(token):
+    if not PROFILING_SECRET or not token:
+        return False
+    expires = token.partition(".")[0]
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(sign(int(expires)), token)
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in sorted(sys.path, key=len, reverse=True):
+            if prefix and filename.startswith(prefix + os.sep):
+                filename = filename[len(prefix) + 1:]
+                break
+        label = _labels[code] = f"{code.co_qualname} ({filename}:{code.co_firstlineno})"
+    return label
+
+
+def _await_chain(coroutine):
+    # a suspended coroutine has no f_back, the await chain is the stack
+    frames = []
+    while coroutine is not None:
+        frame = getattr(coroutine, "cr_frame", None) or getattr(coroutine, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coroutine = getattr(coroutine, "cr_await", None) or getattr(coroutine, "gi_yieldfrom", None)
+    return frames
+
+
+def _call_chain(frame):
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+class Sampler(threading.Thread):
+    """Samples the stack of one request task from a background thread.
+
+    Every sample counts towards wall time: the running stack when the task
+    is on the event loop, otherwise the await chain it is suspended in,
+    which is where time in the hashing pool, the database and Redis shows
+    up. Samples taken while the task is running also count as CPU time.
+
+    This thread only reads the snapshot sys._current_frames() returns; the
+    await chain of a suspended task is walked by a callback on the event
+    loop, where it can't change underneath the walk.
+    """
+
+    def __init__(self, task):
+        super().__init__(name="request-profiler", daemon=True)
+        self.task = task
+        self.loop = task.get_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        # counted from this thread and from the event loop
+        self.lock = threading.Lock()
+        self.wall = collections.Counter()
+        self.cpu = collections.Counter()
+
+    def run(self):
+        while not self.stopped.wait(PROFILING_INTERVAL):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.debug("Profiler sample failed: %s", e)
+
+    def sample(self):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if asyncio.current_task(self.loop) is self.task:
+            self._count(_call_chain(frame), running=True)
+        else:
+            self.loop.call_soon_threadsafe(self._sample_suspended)
+
+    def _sample_suspended(self):
+        # on the event loop, between task steps
+        if not self.stopped.is_set() and not self.task.done():
+            self._count(_await_chain(self.task.get_coro()), running=False)
+
+    def _count(self, frames, running):
+        # drop the event loop and server frames above this middleware
+        start = next((index for index, frame in enumerate(frames)
+                      if frame.f_code is ProfilingMiddleware.__call__.__code__), 0)
+        stack = ";".join(_label(frame.f_code) for frame in frames[start:])
+        with self.lock:
+            self.wall[stack] += 1
+            if running:
+                self.cpu[stack] += 1
+
+    async def stop(self):
+        self.stopped.set()
+        # a sample in progress finishes off the event loop
+        await asyncio.to_thread(self.join)
+
+
+def _should_profile(scope):
+    if scope["path"].startswith(ADMIN_PREFIX) or _active >= PROFILING_MAX_CONCURRENT:
+        return False
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return verify(value.decode("latin-1"))
+    return PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE
+
+
+async def _store(profile):
+    redis_client = redis_setup.redis_info()
+    if not redis_client:
+        logger.warning("Redis unavailable, dropping profile %s", profile["id"])
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(f"profile:{profile['id']}", json.dumps(profile), ex=PROFILING_RETENTION_SECONDS)
+            pipe.zadd(PROFILES_KEY, {profile["id"]: profile["started_at"]})
+            pipe.zremrangebyrank(PROFILES_KEY, 0, -PROFILING_MAX_STORED - 1)
+            pipe.zremrangebyscore(PROFILES_KEY, "-inf", time.time() - PROFILING_RETENTION_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Could not store profile %s: %s", profile["id"], e)
+
+
+class ProfilingMiddleware:
+    """Profiles requests carrying a valid X-Profile token, plus a random sample."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _active
+        if scope["type"] != "http" or not _should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        profile_id = uuid.uuid4().hex
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        _active += 1
+        sampler = Sampler(asyncio.current_task())
+        started_at = time.time()
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            await sampler.stop()
+            wall_ms = (time.perf_counter() - started) * 1000
+            _active -= 1
+            await _store({
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "request_id": request_id_var.get(),
+                "started_at": started_at,
+                "wall_ms": round(wall_ms, 3),
+                "interval_ms": PROFILING_INTERVAL * 1000,
+                "samples": sum(sampler.wall.values()),
+                "cpu_samples": sum(sampler.cpu.values()),
+                "wall": dict(sampler.wall.most_common()),
+                "cpu": dict(sampler.cpu.most_common()),
+            })
+
+
+def require_profiling_token(x_profile: str | None = Header(None)):
+    if not verify(x_profile):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail={"message":"Invalid or missing profiling token"})
+
+
+def _redis():
+    redis_client = redis_setup.redis_info()
+    if not redis_client:
+        raise redis_setup.redis_breaker.unavailable()
+    return redis_client
+
+
+@router.get("", dependencies=[Depends(require_profiling_token)])
+async def list_profiles(limit: int = 20):
+    redis_client = _redis()
+    profile_ids = await redis_client.zrevrange(PROFILES_KEY, 0, max(1, min(limit, PROFILING_MAX_STORED)) - 1)
+    if not profile_ids:
+        return []
+    summaries = []
+    for raw in await redis_client.mget([f"profile:{profile_id}" for profile_id in profile_ids]):
+        if raw is None:
+            continue
+        profile = json.loads(raw)
+        summaries.append({key: profile[key] for key in
+                          ("id", "method", "path", "status", "request_id", "started_at", "wall_ms", "samples", "cpu_samples")})
+    return summaries
+
+
+@router.get("/{profile_id}", dependencies=[Depends(require_profiling_token)])
+async def get_profile(profile_id: str, format: str = "json", kind: str = "wall"):
+    raw = await _redis().get(f"profile:{profile_id}")
+    if raw is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"message":"Profile not found"})
+    if format == "folded":
+        # collapsed stacks, the input format of flamegraph.pl and speedscope
+        stacks = json.loads(raw).get(kind, {})
+        return Response(content="".join(f"{stack} {count}\n" for stack, count in stacks.items()),
+                        media_type="text/plain")
+    return Response(content=raw, media_type="application/json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request profiling tools.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    sign_parser = subcommands.add_parser("sign", help="print an X-Profile token signed with PROFILING_SECRET")
+    sign_parser.add_argument("--ttl", type=int, default=900, help="seconds the token stays valid")
+    args = parser.parse_args()
+
+    if not PROFILING_SECRET:
+        parser.error("PROFILING_SECRET is not set")
+    print(sign(int(time.time()) + args.ttl))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
 
+import asyncio
 import os
-import redis
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
 from dotenv import load_dotenv
 import logging
 
-logging.basicConfig(level=logging.INFO)
+from setup.circuit_breaker import CircuitBreaker
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,19 +16,132 @@ load_dotenv()
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_HEALTH_CHECK_INTERVAL = float(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 5))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.5))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 0.5))
+# connections opened at startup, before the worker reports ready
+REDIS_WARM_CONNECTIONS = int(os.getenv("REDIS_WARM_CONNECTIONS", 10))
 
-def redis_info():
+redis_pool = None
+redis_client = None
+redis_healthy = False
+_health_task = None
+
+redis_breaker = CircuitBreaker("redis")
+
+
+class RedisCircuitOpen(redis.ConnectionError):
+    # a ConnectionError, so the existing fallbacks handle it
+    pass
+
+
+async def _guarded(call):
+    if not redis_breaker.allow_request():
+        raise RedisCircuitOpen("Redis circuit is open")
+    try:
+        result = await call()
+    except (redis.ConnectionError, redis.TimeoutError):
+        redis_breaker.record_failure()
+        raise
+    redis_breaker.record_success()
+    return result
+
+
+class GuardedPipeline(Pipeline):
+    async def execute(self, raise_on_error=True):
+        return await _guarded(lambda: super(GuardedPipeline, self).execute(raise_on_error))
+
+
+class GuardedRedis(redis.Redis):
+    """Redis client whose commands go through redis_breaker."""
+
+    async def execute_command(self, *args, **options):
+        return await _guarded(lambda: super(GuardedRedis, self).execute_command(*args, **options))
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return GuardedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+async def check_health():
+    global redis_healthy
     try:
-        redis_client = redis.Redis(
-            host='host.docker.internal',  # For Windows Docker Desktop
-            port=6379,
-            db=0,
-            decode_responses=True
+        await redis_client.ping()
+        if not redis_healthy:
+            logger.info("Connected to Redis successfully")
+        redis_healthy = True
+    except (redis.ConnectionError, redis.TimeoutError):
+        if redis_healthy:
+            logger.warning("Redis not available")
+        redis_healthy = False
+    return redis_healthy
+
+
+async def _health_loop():
+    while True:
+        await asyncio.sleep(REDIS_HEALTH_CHECK_INTERVAL)
+        await check_health()
+
+
+async def init_redis(client=None):
+    # an already built client (e.g. fakeredis in benchmarks) can be passed in
+    global redis_pool, redis_client, _health_task
+    if client is not None:
+        redis_client = client
+        redis_pool = client.connection_pool
+    else:
+        redis_pool = redis.ConnectionPool(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            decode_responses=True,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
         )
-        redis_client.ping()
-        logger.info("Connected to Redis successfully")
-        return redis_client
-    except redis.ConnectionError:
+        redis_client = GuardedRedis(connection_pool=redis_pool)
+    if not await check_health():
         logger.warning("Redis not available")
-        redis_client = None
-        return redis_client
\ No newline at end of file
+    _health_task = asyncio.create_task(_health_loop())
+
+
+async def warm_up():
+    if not redis_healthy:
+        return
+    # concurrent pings each check out their own pooled connection
+    await asyncio.gather(*(redis_client.ping() for _ in range(min(REDIS_WARM_CONNECTIONS, REDIS_MAX_CONNECTIONS))))
+
+
+async def close_redis():
+    global redis_pool, redis_client, redis_healthy, _health_task
+    if _health_task is not None:
+        _health_task.cancel()
+        _health_task = None
+    if redis_client is not None:
+        await redis_client.aclose()
+        await redis_pool.disconnect()
+    redis_pool = None
+    redis_client = None
+    redis_healthy = False
+
+
+def redis_info():
+    # health is tracked by the background loop and the breaker, so no round trip here
+    if redis_client is None or not redis_healthy or redis_breaker.is_open():
+        return None
+    return redis_client
+
+
+class LuaScript:
+    """A Lua script registered once per client and run by its SHA."""
+
+    def __init__(self, source):
+        self.source = source
+        self._script = None
+
+    def __call__(self, client, keys, args):
+        script = self._script
+        # re-registered only when init_redis has replaced the client
+        if script is None or script.registered_client is not client:
+            script = self._script = client.register_script(self.source)
+        return script(keys=keys, args=args)
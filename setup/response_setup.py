@@ -0,0 +1,56 @@
+import logging
+
+import orjson
+from fastapi import HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.responses import JSONResponse, Response
+
+logger = logging.getLogger(__name__)
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+async def http_exception_handler(request: Request, exc: StarletteHTTPException):
+    if exc.status_code in (status.HTTP_204_NO_CONTENT, status.HTTP_304_NOT_MODIFIED):
+        return Response(status_code=exc.status_code, headers=exc.headers)
+    return ORJSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+
+
+def validation_messages(errors):
+    messages = []
+    for error in errors:
+        loc = [str(part) for part in error["loc"] if part != "body"]
+        field = loc[-1] if loc else "body"
+        if error["type"] in ("missing", "string_too_short"):
+            messages.append(f"{field} is required.")
+        elif error["type"] == "string_type":
+            messages.append(f"{field} must be string.")
+        else:
+            messages.append(f"{field}: {error['msg']}")
+    return messages
+
+
+class ValidationRoute(APIRoute):
+    """Reports request model errors as 400 {"message": [...]} like the old hand-written checks did."""
+
+    # /login has always answered with "messages"
+    DETAIL_KEYS = {"login_user": "messages"}
+
+    def get_route_handler(self):
+        route_handler = super().get_route_handler()
+        detail_key = self.DETAIL_KEYS.get(self.name, "message")
+
+        async def handler(request: Request):
+            try:
+                return await route_handler(request)
+            except RequestValidationError as e:
+                messages = validation_messages(e.errors())
+                logger.error("validation error : %s", messages)
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={detail_key: messages})
+
+        return handler
@@ -0,0 +1,105 @@
+"""Production entry point: python -m setup.server
+
+Runs uvicorn with setup.base:create_app as an app factory. Each worker
+imports the app itself, so this process stays light.
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8000))
+# fixed worker count; sized from CPUs and DB_MAX_CONNECTIONS when unset
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 0))
+# Postgres max_connections, minus what migrations, the audit runner and
+# admin sessions need
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", 100))
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", 10))
+# read here rather than imported from setup.database_setup, which would
+# build the engines in this process; defaults must match it
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+TIMEOUT_KEEP_ALIVE = int(os.getenv("TIMEOUT_KEEP_ALIVE", 5))
+TIMEOUT_GRACEFUL_SHUTDOWN = int(os.getenv("TIMEOUT_GRACEFUL_SHUTDOWN", 20))
+
+
+def connection_budget():
+    # every worker can hold pool_size + max_overflow primary connections
+    return max(1, (DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS) // (DB_POOL_SIZE + DB_MAX_OVERFLOW))
+
+
+def worker_count():
+    budget = connection_budget()
+    if WEB_CONCURRENCY:
+        if WEB_CONCURRENCY > budget:
+            logger.warning("WEB_CONCURRENCY=%s workers can exceed DB_MAX_CONNECTIONS, the budget allows %s",
+                           WEB_CONCURRENCY, budget)
+        return WEB_CONCURRENCY
+    return max(1, min(os.cpu_count() or 1, budget))
+
+
+def prepare_metrics_dir(workers):
+    """Point the workers' metrics at one shared directory, so /metrics covers all of them."""
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not directory:
+        if workers == 1:
+            return None
+        directory = tempfile.mkdtemp(prefix="vienna-pulse-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = directory
+    os.makedirs(directory, exist_ok=True)
+    # files left by a previous run would be added to this run's counters
+    for name in os.listdir(directory):
+        if name.endswith(".db"):
+            os.remove(os.path.join(directory, name))
+    return directory
+
+
+def main():
+    import uvicorn
+    from setup.logging_setup import configure_logging
+
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Run the ViennaPulse API.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, help="defaults to WEB_CONCURRENCY or the CPU/DB budget")
+    args = parser.parse_args()
+
+    workers = args.workers or worker_count()
+    # argon2 is CPU bound: split the cores between the workers' hashing
+    # pools instead of giving every worker one process per core
+    os.environ.setdefault("HASHING_POOL_SIZE", str(max(1, (os.cpu_count() or 1) // workers)))
+    # before the workers start, they inherit it and must see it on import
+    own_metrics_dir = not os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    metrics_dir = prepare_metrics_dir(workers)
+    logger.info("Starting %s workers on %s:%s, hashing pool size %s, metrics directory %s",
+                workers, args.host, args.port, os.environ["HASHING_POOL_SIZE"], metrics_dir)
+    try:
+        uvicorn.run(
+            "setup.base:create_app",
+            factory=True,
+            host=args.host,
+            port=args.port,
+            workers=workers,
+            # logging is configured by create_app in each worker
+            log_config=None,
+            proxy_headers=True,
+            timeout_keep_alive=TIMEOUT_KEEP_ALIVE,
+            timeout_graceful_shutdown=TIMEOUT_GRACEFUL_SHUTDOWN,
+        )
+    finally:
+        # only a directory this launcher made up, not a configured one
+        if metrics_dir and own_metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+
+# settings are read at import time, so they're set before any app module loads
+_tmp = tempfile.mkdtemp(prefix="vienna-pulse-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{_tmp}/test.db",
+    "DATABASE_REPLICA_URLS": "",
+    "SECRET": "test-secret-" + "x" * 32,
+    "ALGORITHM": "HS256",
+    "JWT_KEYS_DIR": f"{_tmp}/keys",
+    "AUDIT_SINK": "none",
+    "RATE_LIMIT_ENABLED": "false",
+    "SINGLE_FLIGHT_REDIS": "false",
+    "PROFILING_ENABLED": "false",
+    "HASHING_POOL_SIZE": "1",
+    "ARGON2_MEMORY_COST": "8192",
+    "ARGON2_TIME_COST": "1",
+    "ADMIN_API_TOKENS": "test-admin-token",
+    "METRICS_TOKEN": "test-metrics-token",
+})
+
+import fakeredis
+import httpx
+import pytest
+
+from app import credential_cache, tokens
+from setup import database_setup, hashing_setup, message_dispatcher, redis_setup
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def redis_client():
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await redis_setup.init_redis(client=client)
+    yield client
+    await redis_setup.close_redis()
+
+
+@pytest.fixture
+async def db():
+    async with database_setup.engine.begin() as connection:
+        await connection.run_sync(database_setup.Base.metadata.create_all)
+    credential_cache._local_cache.clear()
+    async with database_setup.session_local() as session:
+        yield session
+    async with database_setup.engine.begin() as connection:
+        await connection.run_sync(database_setup.Base.metadata.drop_all)
+    await database_setup.engine.dispose()
+
+
+@pytest.fixture
+async def client(db, redis_client):
+    from providers.mock_provider import MockMessageProvider
+    from setup.base import create_app
+
+    tokens.load_keys()
+    message_dispatcher.start_dispatcher(MockMessageProvider())
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app()), base_url="http://test") as http:
+        yield http
+    await message_dispatcher.stop_dispatcher()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def hashing_pool():
+    yield
+    hashing_setup.shutdown_executor()
@@ -0,0 +1,84 @@
+import orjson
+import pytest
+from sqlalchemy import select
+
+from models.audit import AuditEvent
+from setup import audit_service_runner, audit_sinks
+
+pytestmark = pytest.mark.anyio
+
+
+def event(event_id, **overrides):
+    return {"event_id": event_id, "event_type": "login", "outcome": "success",
+            "occurred_at": "2026-10-18T08:00:00+00:00", **overrides}
+
+
+@pytest.fixture
+async def source(redis_client, monkeypatch):
+    monkeypatch.setattr(audit_service_runner, "AUDIT_CLAIM_IDLE_MS", 0)
+    monkeypatch.setattr(audit_service_runner, "AUDIT_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(audit_service_runner, "AUDIT_MAX_DELIVERIES", 3)
+    stream_source = audit_service_runner.RedisStreamSource(redis_client)
+    await stream_source.start()
+    return stream_source
+
+
+async def add(redis_client, *events):
+    for payload in events:
+        await redis_client.xadd(audit_sinks.AUDIT_STREAM, {"event": payload})
+
+
+async def stored_ids(db):
+    return set((await db.execute(select(AuditEvent.event_id))).scalars())
+
+
+async def dead_letters(redis_client):
+    return await redis_client.xrange(audit_service_runner.AUDIT_DEAD_LETTER_STREAM)
+
+
+async def test_stores_and_acknowledges_events(db, redis_client, source):
+    await add(redis_client, orjson.dumps(event("a")), orjson.dumps(event("b")))
+    assert await audit_service_runner.store_batch(source, db, 10)
+    assert await stored_ids(db) == {"a", "b"}
+    assert (await redis_client.xpending(audit_sinks.AUDIT_STREAM, audit_service_runner.AUDIT_CONSUMER_GROUP))["pending"] == 0
+
+
+async def test_unparseable_entries_are_dead_lettered_at_once(db, redis_client, source):
+    await add(redis_client, b"{not json", orjson.dumps(event("a")))
+    assert await audit_service_runner.store_batch(source, db, 10)
+    assert await stored_ids(db) == {"a"}
+    [(_, fields)] = await dead_letters(redis_client)
+    assert fields["event"] == "{not json"
+    assert fields["reason"] == "malformed"
+
+
+async def test_an_entry_the_database_rejects_is_dead_lettered_after_the_limit(db, redis_client, source):
+    poison = event("poison")
+    del poison["event_type"]
+    await add(redis_client, orjson.dumps(event("a")), orjson.dumps(poison), orjson.dumps(event("b")))
+    # the first batch fails as a whole; the entries are then retried one by one
+    assert not await audit_service_runner.store_batch(source, db, 10)
+    await add(redis_client, orjson.dumps(event("c")))
+    for _ in range(10):
+        await audit_service_runner.store_batch(source, db, 10)
+    assert await stored_ids(db) == {"a", "b", "c"}
+    [(_, fields)] = await dead_letters(redis_client)
+    assert orjson.loads(fields["event"])["event_id"] == "poison"
+    assert (await redis_client.xpending(audit_sinks.AUDIT_STREAM, audit_service_runner.AUDIT_CONSUMER_GROUP))["pending"] == 0
+
+
+async def test_waits_for_the_database_before_reading_again(db, monkeypatch):
+    monkeypatch.setattr(audit_service_runner, "AUDIT_POLL_SECONDS", 0.01)
+    execute = db.execute
+    attempts = 0
+
+    async def flaky_execute(statement, *args, **kwargs):
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise ConnectionError("database is down")
+        return await execute(statement, *args, **kwargs)
+
+    monkeypatch.setattr(db, "execute", flaky_execute)
+    await audit_service_runner.wait_for_database(db)
+    assert attempts == 3
@@ -0,0 +1,54 @@
+import pytest
+
+from app import otp_store
+
+pytestmark = pytest.mark.anyio
+
+USER = {"first_name": "Anna", "last_name": "Huber", "username": "AnnaH", "email": "Anna@Example.com",
+        "password": "secret12", "phone_number": "0664 111 2222"}
+
+
+async def test_register_and_login_case_insensitively(client):
+    assert (await client.post("/api/register", json=USER)).status_code == 201
+    response = await client.post("/api/login", json={"username": "annah", "password": "secret12"})
+    assert response.status_code == 200
+    assert response.json()["refresh_token"]
+    response = await client.post("/api/login/email", json={"email": "ANNA@example.com", "password": "secret12"})
+    assert response.status_code == 200
+
+
+async def test_wrong_password_is_rejected(client):
+    await client.post("/api/register", json=USER)
+    response = await client.post("/api/login", json={"username": "annah", "password": "wrong-password"})
+    assert response.status_code == 401
+
+
+async def test_duplicate_registration_in_another_spelling_is_rejected(client):
+    await client.post("/api/register", json=USER)
+    response = await client.post("/api/register", json={**USER, "username": "annah", "email": "anna@example.com",
+                                                        "phone_number": "+43 664 1112222"})
+    assert response.status_code == 400
+
+
+async def test_phone_login_with_otp(client, redis_client):
+    await client.post("/api/register", json=USER)
+    assert (await client.post("/api/login/otp", json={"phone_number": "0664 111 2222"})).status_code == 200
+    otp = await redis_client.get(otp_store.otp_key("+436641112222"))
+    response = await client.post("/api/login/phone", json={"phone_number": "+43 664 111 2222", "otp": otp})
+    assert response.status_code == 200
+    response = await client.post("/api/login/phone", json={"phone_number": "+43 664 111 2222", "otp": otp})
+    assert response.status_code == 401
+
+
+async def test_refresh_and_logout(client):
+    await client.post("/api/register", json=USER)
+    login = (await client.post("/api/login", json={"username": "annah", "password": "secret12"})).json()
+    refreshed = await client.post("/api/token/refresh", json={"refresh_token": login["refresh_token"]})
+    assert refreshed.status_code == 200
+    # the old refresh token was used up
+    assert (await client.post("/api/token/refresh", json={"refresh_token": login["refresh_token"]})).status_code == 401
+    token = refreshed.json()["token"]
+    response = await client.post("/api/logout", json={}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    response = await client.post("/api/logout", json={}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
@@ -0,0 +1,39 @@
+import pytest
+
+from app import availability
+from models.users import Users
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def bloom_filter(monkeypatch):
+    monkeypatch.setattr(availability, "_filter", availability.BloomFilter(1000, 0.01))
+    monkeypatch.setattr(availability, "_ready", True)
+    monkeypatch.setattr(availability, "_last_user_id", 0)
+
+
+def user(user_id, username):
+    return Users(id=user_id, first_name="Anna", last_name="Huber", username=username,
+                 email=f"{username}@example.com", password="x", active_status=True)
+
+
+async def test_loads_new_users(db, bloom_filter):
+    db.add_all([user(1, "annah"), user(2, "bertb")])
+    await db.commit()
+    await availability._load_new_users()
+    assert availability.might_exist("username", "AnnaH")
+    assert availability.might_exist("email", "bertb@example.com")
+    assert not availability.might_exist("username", "carlm")
+    assert availability._last_user_id == 2
+
+
+async def test_a_lower_id_committed_late_is_picked_up(db, bloom_filter):
+    db.add_all([user(1, "annah"), user(3, "carlm")])
+    await db.commit()
+    await availability._load_new_users()
+    db.add(user(2, "bertb"))
+    await db.commit()
+    await availability._load_new_users()
+    assert availability.might_exist("username", "bertb")
+    assert availability._last_user_id == 3
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+from sqlalchemy import select
+
+from app import bulk_register, identifiers
+from models.users import Users
+
+pytestmark = pytest.mark.anyio
+
+
+def line(username, email, phone_number, **overrides):
+    record = {"first_name": "Anna", "last_name": "Huber", "username": username, "email": email,
+              "password": "secret12", "phone_number": phone_number}
+    record.update(overrides)
+    return json.dumps(record).encode()
+
+
+async def register(lines, batch_size=bulk_register.BULK_BATCH_SIZE):
+    return [result async for result in bulk_register.register_stream(lines, batch_size)]
+
+
+async def test_registers_valid_lines_and_reports_invalid_ones(db):
+    results = await register([
+        line("annah", "anna@example.com", "06641110001"),
+        b"",
+        line("x", "bad", None),
+        line("carlm", "carl@example.com", None),
+    ])
+    assert sorted((result["line"], result["status"]) for result in results) == [(1, "created"), (3, "invalid"), (4, "created")]
+    rows = (await db.execute(select(Users.username, Users.phone_normalized).order_by(Users.id))).all()
+    assert rows == [("annah", "+436641110001"), ("carlm", None)]
+
+
+async def test_duplicates_in_one_batch_keep_the_first(db):
+    results = await register([
+        line("annah", "anna@example.com", None),
+        line("AnnaH", "other@example.com", None),
+        line("bertb", "ANNA@example.com", None),
+    ])
+    assert [result["status"] for result in results] == ["created", "conflict", "conflict"]
+
+
+async def test_existing_users_conflict_case_insensitively(db):
+    db.add(Users(first_name="Anna", last_name="Huber", username="annah", email="anna@example.com", password="x",
+                 active_status=True, **identifiers.normalized_columns("annah", "anna@example.com")))
+    await db.commit()
+    results = await register([
+        line("ANNAH", "new@example.com", None),
+        line("carlm", "carl@example.com", None),
+    ], batch_size=1)
+    assert [result["status"] for result in results] == ["conflict", "created"]
+
+
+async def test_passwords_are_hashed(db):
+    await register([line("annah", "anna@example.com", None)])
+    stored = (await db.execute(select(Users.password))).scalar_one()
+    assert stored.startswith("$argon2")
@@ -0,0 +1,92 @@
+import pytest
+
+from setup import circuit_breaker
+from setup.circuit_breaker import CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=10, half_open_calls=1)
+    yield breaker
+    circuit_breaker.breakers.pop("test", None)
+
+
+def test_opens_after_consecutive_failures(breaker):
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == circuit_breaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == circuit_breaker.OPEN
+    assert breaker.is_open()
+    assert not breaker.allow_request()
+
+
+def test_success_resets_the_failure_count(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == circuit_breaker.CLOSED
+
+
+def test_half_open_lets_a_limited_number_of_probes_through(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow_request()
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    assert not breaker.allow_request()
+
+
+def test_probe_success_closes(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == circuit_breaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_probe_failure_reopens(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == circuit_breaker.OPEN
+    assert not breaker.allow_request()
+    assert breaker.retry_after() == 10
+
+
+def test_lost_probe_does_not_keep_it_stuck(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow_request()
+    # the probe never reports back
+    clock.now += 10
+    assert breaker.allow_request()
+
+
+def test_unavailable_is_a_503_with_retry_after(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    error = breaker.unavailable()
+    assert error.status_code == 503
+    assert error.headers["Retry-After"] == "10"
@@ -0,0 +1,49 @@
+import pytest
+
+from app import credential_cache, identifiers, otp_store
+from models.users import Users
+from setup.hashing_setup import hash_password
+
+pytestmark = pytest.mark.anyio
+
+
+async def add_legacy_user(db, username, email, phone_number, password="secret12"):
+    # stored before the identifier backfill, normalised columns still NULL
+    user = Users(first_name="Anna", last_name="Huber", username=username, email=email, phone_number=phone_number,
+                 password=await hash_password(password), active_status=True)
+    db.add(user)
+    await db.commit()
+    return user.id
+
+
+async def test_normalised_spellings_share_one_entry(db, redis_client):
+    db.add(Users(first_name="Anna", last_name="Huber", username="annah", email="anna@example.com", password="x",
+                 active_status=True, **identifiers.normalized_columns("annah", "anna@example.com")))
+    await db.commit()
+    credentials = await credential_cache.get_credentials(db, "email", "Anna@Example.com")
+    assert credentials is not None
+    assert await redis_client.get("cred:email:anna@example.com")
+    await credential_cache.invalidate(email="ANNA@example.com")
+    assert await redis_client.get("cred:email:anna@example.com") is None
+
+
+async def test_legacy_rows_are_matched_as_typed_and_not_cached(db, redis_client):
+    user_id = await add_legacy_user(db, "AnnaH", "Anna@Example.com", "0664 1234567")
+    for field, value in (("username", "AnnaH"), ("email", "Anna@Example.com"), ("phone_number", "0664 1234567")):
+        credentials = await credential_cache.get_credentials(db, field, value)
+        assert credentials.id == user_id
+    assert await redis_client.keys("cred:*") == []
+
+
+async def test_legacy_row_stored_in_e164_is_matched_from_another_spelling(db, redis_client):
+    user_id = await add_legacy_user(db, "annah", "anna@example.com", "+436641234567")
+    credentials = await credential_cache.get_credentials(db, "phone_number", "0664 1234567")
+    assert credentials.id == user_id
+
+
+async def test_phone_login_for_a_legacy_row(client, db, redis_client):
+    await add_legacy_user(db, "annah", "anna@example.com", "0664 1234567")
+    assert (await client.post("/api/login/otp", json={"phone_number": "0664 1234567"})).status_code == 200
+    otp = await redis_client.get(otp_store.otp_key("+436641234567"))
+    response = await client.post("/api/login/phone", json={"phone_number": "0664 1234567", "otp": otp})
+    assert response.status_code == 200
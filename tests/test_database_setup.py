@@ -0,0 +1,24 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from setup import database_setup
+
+pytestmark = pytest.mark.anyio
+
+
+def observed():
+    return database_setup._db_execute_latency._sum.get()
+
+
+async def test_failed_statements_leave_no_timing_state(db):
+    connection = await db.connection()
+    before = observed()
+    for _ in range(3):
+        with pytest.raises(OperationalError):
+            await connection.execute(text("SELECT * FROM missing_table"))
+        await db.rollback()
+        connection = await db.connection()
+    assert (await connection.execute(text("SELECT 1"))).scalar() == 1
+    assert observed() > before
+    assert "query_started" not in connection.sync_connection.info
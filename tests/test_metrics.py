@@ -0,0 +1,20 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_metrics_need_the_metrics_token(client):
+    assert (await client.get("/metrics")).status_code == 401
+    response = await client.get("/metrics", headers={"Authorization": "Bearer test-admin-token"})
+    assert response.status_code == 401
+    response = await client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"})
+    assert response.status_code == 200
+    assert "vienna_pulse_request_duration_seconds" in response.text
+
+
+async def test_requests_are_labelled_with_the_route_template(client):
+    await client.get("/api/register/available", params={"username": "annah"})
+    await client.get("/no/such/path")
+    response = await client.get("/metrics", headers={"Authorization": "Bearer test-metrics-token"})
+    assert 'endpoint="/api/register/available"' in response.text
+    assert 'endpoint="unmatched"' in response.text
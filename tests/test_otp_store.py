@@ -0,0 +1,43 @@
+import pytest
+
+from app import otp_store
+
+pytestmark = pytest.mark.anyio
+
+PHONE = "+436641234567"
+
+
+async def test_only_one_live_otp_per_number(redis_client):
+    assert await otp_store.issue(redis_client, PHONE, "123456")
+    assert not await otp_store.issue(redis_client, PHONE, "654321")
+    assert await redis_client.get(otp_store.otp_key(PHONE)) == "123456"
+
+
+async def test_consume_is_single_use(redis_client):
+    await otp_store.issue(redis_client, PHONE, "123456")
+    assert await otp_store.consume(redis_client, PHONE, "123456") == otp_store.CONSUMED
+    assert await otp_store.consume(redis_client, PHONE, "123456") == otp_store.MISSING
+
+
+async def test_wrong_guesses_are_counted_with_the_otp_ttl(redis_client):
+    await otp_store.issue(redis_client, PHONE, "123456", ttl=60)
+    assert await otp_store.consume(redis_client, PHONE, "000000") == otp_store.MISMATCH
+    assert await redis_client.get(otp_store.attempts_key(PHONE)) == "1"
+    assert 0 < await redis_client.ttl(otp_store.attempts_key(PHONE)) <= 60
+    # a right guess after a wrong one still works, and clears the counter
+    assert await otp_store.consume(redis_client, PHONE, "123456") == otp_store.CONSUMED
+    assert await redis_client.exists(otp_store.attempts_key(PHONE)) == 0
+
+
+async def test_otp_is_burned_after_max_attempts(redis_client):
+    await otp_store.issue(redis_client, PHONE, "123456")
+    for _ in range(2):
+        assert await otp_store.consume(redis_client, PHONE, "000000", max_attempts=3) == otp_store.MISMATCH
+    assert await otp_store.consume(redis_client, PHONE, "000000", max_attempts=3) == otp_store.LOCKED
+    assert await otp_store.consume(redis_client, PHONE, "123456", max_attempts=3) == otp_store.MISSING
+
+
+async def test_revoke_allows_a_new_otp(redis_client):
+    await otp_store.issue(redis_client, PHONE, "123456")
+    await otp_store.revoke(redis_client, PHONE)
+    assert await otp_store.issue(redis_client, PHONE, "654321")
@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+import pytest
+
+from setup import profiling_setup
+
+pytestmark = pytest.mark.anyio
+
+
+async def waits_for_io():
+    await asyncio.sleep(0.1)
+
+
+def burns_cpu():
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def request():
+    await waits_for_io()
+    burns_cpu()
+
+
+async def test_samples_suspended_and_running_stacks(monkeypatch):
+    monkeypatch.setattr(profiling_setup, "PROFILING_INTERVAL", 0.005)
+    task = asyncio.create_task(request())
+    sampler = profiling_setup.Sampler(task)
+    sampler.start()
+    await task
+    await sampler.stop()
+    assert not sampler.is_alive()
+    assert any("waits_for_io" in stack for stack in sampler.wall)
+    assert any("burns_cpu" in stack for stack in sampler.cpu)
+    assert not any("waits_for_io" in stack for stack in sampler.cpu)
@@ -0,0 +1,97 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app import rate_limit
+from app.local_cache import LocalCache
+from app.rate_limit import Limit
+
+pytestmark = pytest.mark.anyio
+
+WINDOW_START = 6000.0
+
+
+@pytest.fixture
+def now(monkeypatch):
+    clock = {"now": WINDOW_START}
+    monkeypatch.setattr(rate_limit.time, "time", lambda: clock["now"])
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def local_windows(monkeypatch):
+    windows = LocalCache(rate_limit.LOCAL_WINDOWS_MAX_KEYS)
+    monkeypatch.setattr(rate_limit, "_local_windows", windows)
+    return windows
+
+
+async def hit(key, limit, times):
+    for _ in range(times):
+        await rate_limit.enforce([(key, limit)])
+
+
+async def test_allows_up_to_the_limit(redis_client, now):
+    await hit("ip:1", Limit(3, 60), 3)
+    with pytest.raises(HTTPException) as error:
+        await rate_limit.enforce([("ip:1", Limit(3, 60))])
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) >= 1
+
+
+async def test_keys_are_counted_separately(redis_client, now):
+    await hit("ip:1", Limit(2, 60), 2)
+    await hit("ip:2", Limit(2, 60), 2)
+
+
+async def test_previous_window_is_weighted(redis_client, now):
+    limit = Limit(4, 60)
+    await hit("ip:1", limit, 4)
+    # halfway through the next window half of the previous one still counts
+    now["now"] += 90
+    await hit("ip:1", limit, 2)
+    with pytest.raises(HTTPException):
+        await rate_limit.enforce([("ip:1", limit)])
+
+
+async def test_window_expires(redis_client, now):
+    limit = Limit(2, 60)
+    await hit("ip:1", limit, 2)
+    now["now"] += 120
+    await hit("ip:1", limit, 2)
+
+
+async def test_falls_back_to_local_counters_without_redis(now, local_windows):
+    await hit("ip:1", Limit(2, 60), 2)
+    with pytest.raises(HTTPException):
+        await rate_limit.enforce([("ip:1", Limit(2, 60))])
+    assert len(local_windows) == 1
+
+
+async def test_local_counters_are_bounded(now, monkeypatch):
+    windows = LocalCache(100)
+    monkeypatch.setattr(rate_limit, "_local_windows", windows)
+    for i in range(1000):
+        await rate_limit.enforce([(f"id:{i}", Limit(5, 60)), ("ip:1", Limit(10000, 60))])
+    assert len(windows) == 100
+    # the key seen on every request survives the churn
+    assert windows.get(rate_limit._window_keys("ip:1", Limit(10000, 60), now["now"])[0]) == [1000]
+
+
+def request(path, body=b""):
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": [], "client": ("10.0.0.1", 1234)}
+    return Request(scope, receive)
+
+
+async def test_availability_checks_do_not_use_up_the_login_budget(redis_client, now, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_IP", Limit(2, 60))
+    check_availability = rate_limit.limit_client("avail", Limit(2, 60))
+    login = rate_limit.limit_login("username")
+    for _ in range(2):
+        await check_availability(request("/api/register/available"))
+    with pytest.raises(HTTPException):
+        await check_availability(request("/api/register/available"))
+    await login(request("/api/login", b'{"username": "annah"}'))
@@ -0,0 +1,34 @@
+import pytest
+
+from app import refresh_tokens
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_rotation_swaps_the_token(redis_client):
+    token = await refresh_tokens.issue(redis_client, 7)
+    result, user_id, new_token = await refresh_tokens.rotate(redis_client, token)
+    assert (result, user_id) == (refresh_tokens.ROTATED, 7)
+    assert new_token != token
+    assert new_token.split(".")[0] == token.split(".")[0]
+    result, user_id, _ = await refresh_tokens.rotate(redis_client, new_token)
+    assert (result, user_id) == (refresh_tokens.ROTATED, 7)
+
+
+async def test_reuse_revokes_the_whole_family(redis_client):
+    token = await refresh_tokens.issue(redis_client, 7)
+    _, _, new_token = await refresh_tokens.rotate(redis_client, token)
+    assert (await refresh_tokens.rotate(redis_client, token))[0] == refresh_tokens.REUSED
+    # the legitimate successor is dead too
+    assert (await refresh_tokens.rotate(redis_client, new_token))[0] == refresh_tokens.INVALID
+
+
+@pytest.mark.parametrize("token", ["", "no-dot", "family.", ".secret", "unknown.secret"])
+async def test_malformed_or_unknown_tokens_are_invalid(redis_client, token):
+    assert await refresh_tokens.rotate(redis_client, token) == (refresh_tokens.INVALID, None, None)
+
+
+async def test_secret_is_stored_hashed(redis_client):
+    token = await refresh_tokens.issue(redis_client, 7)
+    secret = token.split(".", 1)[1]
+    assert not [key for key in await redis_client.keys("refresh:*") if secret in key]
@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from app import revocation
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def empty_denylist():
+    revocation._revoked.clear()
+    revocation._expiries.clear()
+    yield
+    revocation._revoked.clear()
+    revocation._expiries.clear()
+
+
+async def test_revoked_token_is_denied_and_stored(redis_client):
+    exp = time.time() + 60
+    await revocation.revoke("jti-1", exp)
+    assert revocation.is_revoked("jti-1")
+    assert not revocation.is_revoked("jti-2")
+    assert await redis_client.zscore(revocation.REVOKED_KEY, "jti-1") == pytest.approx(exp)
+
+
+async def test_expired_tokens_are_not_kept(redis_client):
+    await revocation.revoke("old", time.time() - 1)
+    assert not revocation.is_revoked("old")
+    assert await redis_client.zscore(revocation.REVOKED_KEY, "old") is None
+
+
+async def test_load_mirrors_only_live_entries(redis_client):
+    now = time.time()
+    await redis_client.zadd(revocation.REVOKED_KEY, {"live": now + 60, "dead": now - 60})
+    await revocation._load(redis_client)
+    assert revocation.is_revoked("live")
+    assert not revocation.is_revoked("dead")
+
+
+def test_expired_entries_are_pruned_as_new_ones_arrive(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(revocation.time, "time", lambda: now)
+    for i in range(100):
+        revocation._remember(f"short-{i}", now + 10)
+    revocation._remember("long", now + 60)
+    now += 30
+    revocation._remember("new", now + 60)
+    assert set(revocation._revoked) == {"long", "new"}
+    assert len(revocation._expiries) == 2
+
+
+async def test_revoke_without_redis_fails_closed():
+    with pytest.raises(Exception) as error:
+        await revocation.revoke("jti-1", time.time() + 60)
+    assert error.value.status_code == 503
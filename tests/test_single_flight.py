@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from app import single_flight
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_callers_share_one_run():
+    runs = 0
+
+    async def work():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.05)
+        return runs
+
+    results = await asyncio.gather(*(single_flight.do("test", "key", work) for _ in range(5)))
+    assert results == [1] * 5
+    assert runs == 1
+    assert "key" not in single_flight._inflight
+    # a later call runs again
+    assert await single_flight.do("test", "key", work) == 2
+
+
+async def test_exceptions_are_shared():
+    runs = 0
+
+    async def work():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(*(single_flight.do("test", "fail", work) for _ in range(3)), return_exceptions=True)
+    assert [type(result) for result in results] == [RuntimeError] * 3
+    assert runs == 1
+
+
+async def test_a_cancelled_caller_does_not_cancel_the_others():
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    first = asyncio.create_task(single_flight.do("test", "cancel", work))
+    second = asyncio.create_task(single_flight.do("test", "cancel", work))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    assert await second == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+async def test_other_workers_reuse_the_leaders_result(redis_client):
+    runs = 0
+
+    async def work():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.1)
+        return [7, True]
+
+    key = single_flight.flight_key("login", "username", "anna", "pw")
+    # two workers: each goes through Redis, neither shares the in-process map
+    results = await asyncio.gather(single_flight._across_workers("test", key, work),
+                                   single_flight._across_workers("test", key, work))
+    assert results == [[7, True], [7, True]]
+    assert runs == 1
+    assert await redis_client.get(f"sf:{key}") is None
+
+
+async def test_a_failed_leader_lets_the_followers_run(redis_client):
+    runs = 0
+
+    async def fail():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.05)
+        raise RuntimeError("boom")
+
+    async def work():
+        nonlocal runs
+        runs += 1
+        return "ok"
+
+    key = single_flight.flight_key("otp", "+436641234567")
+    results = await asyncio.gather(single_flight._across_workers("test", key, fail),
+                                   single_flight._across_workers("test", key, work), return_exceptions=True)
+    assert isinstance(results[0], RuntimeError)
+    assert results[1] == "ok"
+    assert runs == 2
+
+
+def test_keys_do_not_contain_the_password():
+    key = single_flight.flight_key("login", "username", "anna", "hunter2")
+    assert "hunter2" not in key
+    assert key == single_flight.flight_key("login", "username", "anna", "hunter2")
+    assert key != single_flight.flight_key("login", "username", "anna", "hunter3")